@@ -1,8 +1,13 @@
+import altair as alt
 import streamlit as st
 from snowflake.snowpark.context import get_active_session
-import pandas as pd
 from datetime import datetime, timedelta
 
+from logsearch import advisor, alerts, anomaly, compare, context, fields, governor, partitions, results, sizing
+from logsearch.query import (
+    PREVIEW_CHARS, PREVIEW_COLUMNS, TABLE_FQN, build_query, build_where, select_list, tag_query, union_select,
+)
+
 session = get_active_session()
 
 # --- Custom CSS ---
@@ -118,7 +123,11 @@ with st.sidebar:
         index=4,
     )
 
-    now = datetime.now()
+    # Presets follow the session clock: TIMESTAMP holds session-local time (README 1.11)
+    if "kw_clock_offset" not in st.session_state:
+        session_now = session.sql("SELECT CURRENT_TIMESTAMP()::TIMESTAMP_NTZ AS NOW").collect()[0]["NOW"]
+        st.session_state["kw_clock_offset"] = session_now - datetime.now()
+    now = datetime.now() + st.session_state["kw_clock_offset"]
     if time_preset == "Last 1 hour":
         start_time = now - timedelta(hours=1)
         end_time = now
@@ -152,6 +161,10 @@ with st.sidebar:
         start_time = datetime.combine(start_date, datetime.min.time())
         end_time = datetime.combine(end_date, datetime.max.time())
 
+    # Only the partitions overlapping the time range are scanned, plus LOGS for uncovered months
+    log_partitions = partitions.list_partitions(session)
+    search_tables = partitions.route(log_partitions, start_time, end_time)
+
     # Severity filter
     st.subheader("Severity")
     severities = st.multiselect(
@@ -161,8 +174,11 @@ with st.sidebar:
     )
 
     # Source filter
+    sources_sql, sources_params = union_select(
+        search_tables, "DISTINCT SOURCE", "TIMESTAMP BETWEEN ? AND ?", [start_time, end_time]
+    )
     sources_df = session.sql(
-        "SELECT DISTINCT SOURCE FROM LOG_SEARCH_APP.PUBLIC.LOGS ORDER BY SOURCE"
+        f"SELECT DISTINCT SOURCE FROM ({sources_sql}) ORDER BY SOURCE", params=sources_params
     ).to_pandas()
     all_sources = sources_df["SOURCE"].tolist()
 
@@ -182,15 +198,59 @@ with st.sidebar:
         help="OR: any keyword matches. AND: all keywords must match. PHRASE: exact phrase match.",
     )
 
+    # Extracted fields (FIELDS column)
+    st.subheader("Fields")
+    field_filter_text = st.text_input(
+        "Field filters",
+        placeholder="例: http_status=503 service=payment-service",
+        help="Matches values extracted into the FIELDS column at ingest time. Space-separated field=value pairs.",
+    )
+    try:
+        field_filters = fields.parse_filters(field_filter_text)
+    except ValueError as e:
+        st.warning(str(e))
+        field_filters = {}
+
     # Max results
     max_results = st.slider("Max results", 1000, 10000000, 10000, step=1000)
 
+    # --- Saved Searches & Alert Rules ---
+    st.markdown("---")
+    st.subheader("Saved Search / Alert")
+    saved_name = st.text_input("Name", placeholder="例: payment pool exhausted")
+    if field_filters:
+        st.caption("Field filters are not stored with saved searches.")
+    alert_enabled = st.checkbox("Create alert rule", value=False)
+    if alert_enabled:
+        col_thr, col_win = st.columns(2)
+        with col_thr:
+            alert_threshold = st.number_input("More than", min_value=0, value=50, step=10)
+        with col_win:
+            alert_window = st.number_input("per minutes", min_value=1, max_value=1440, value=5)
+
+    if st.button("Save current search"):
+        if not saved_name.strip():
+            st.warning("Please enter a name.")
+        else:
+            try:
+                search_id = alerts.save_search(
+                    session,
+                    saved_name.strip(),
+                    st.session_state.get("search_query", ""),
+                    search_mode,
+                    severities if len(severities) < 5 else [],
+                    selected_sources if len(selected_sources) < len(all_sources) else [],
+                )
+                if alert_enabled:
+                    alerts.add_rule(session, search_id, alert_window, alert_threshold)
+                st.success(f"Saved **{saved_name.strip()}**.")
+            except Exception as e:
+                st.error(f"Failed to save: {e}")
+
     # --- Search Optimization Management ---
     st.markdown("---")
     st.subheader("Search Optimization")
 
-    TABLE_FQN = "LOG_SEARCH_APP.PUBLIC.LOGS"
-
     def get_so_status():
         try:
             result = session.sql(
@@ -201,6 +261,9 @@ with st.sidebar:
             return None
 
     so_status = get_so_status()
+    so_active = so_status is not None and any(
+        r.get('"active"') in ("true", True) for _, r in so_status.iterrows()
+    )
 
     if so_status is not None and len(so_status) > 0:
         st.success("Status: Configured")
@@ -247,6 +310,24 @@ with st.sidebar:
             except Exception as e:
                 st.error(f"Failed to enable: {e}")
 
+    # --- Time Partitions ---
+    if log_partitions:
+        st.markdown("---")
+        st.subheader("Partitions")
+        searched = sum(1 for part in log_partitions if part.table in search_tables)
+        unpartitioned = " + LOGS" if TABLE_FQN in search_tables else ""
+        st.caption(f"Searching {searched} of {len(log_partitions)} monthly tables{unpartitioned}")
+        for part in reversed(log_partitions):
+            col_p, col_so = st.columns([3, 2])
+            so_label = "SO on" if part.search_optimization else "SO off"
+            col_p.caption(f"`{part.table.rsplit('.', 1)[1]}` {part.rows:,} rows ({so_label})")
+            if col_so.button("Drop SO" if part.search_optimization else "Add SO", key=f"so_{part.table}"):
+                try:
+                    partitions.set_search_optimization(session, part.table, not part.search_optimization)
+                    st.success("Updated. Please reload the page.")
+                except Exception as e:
+                    st.error(f"Failed to update: {e}")
+
     # --- Warehouse Size Management ---
     st.markdown("---")
     st.subheader("Warehouse")
@@ -282,86 +363,276 @@ with st.sidebar:
             session.sql(
                 f"ALTER WAREHOUSE {WH_NAME} SET WAREHOUSE_SIZE = '{WH_SIZE_MAP[new_size]}'"
             ).collect()
+            # A size chosen by hand is not reverted by a running heavy search
+            session.sql(f"ALTER WAREHOUSE {WH_NAME} UNSET COMMENT").collect()
             st.success(f"Warehouse resized to **{new_size}**. Please reload the page.")
         except Exception as e:
             st.error(f"Failed to resize: {e}")
 
+    # Per-search sizing from EXPLAIN estimates
+    st.caption(
+        f"Searches over {sizing.format_bytes(sizing.HEAVY_BYTES)} run on **{sizing.HEAVY_WAREHOUSE}** "
+        f"(or {WH_NAME} temporarily at {sizing.HEAVY_SIZE}); others stay on {WH_NAME}."
+    )
+    auto_narrow = st.checkbox(
+        f"Auto-narrow searches over {sizing.format_bytes(sizing.RUNAWAY_BYTES)}",
+        value=True,
+        help="Shrinks the time range to the most recent part that fits the scan budget.",
+    )
+
 # --- Search Bar ---
 search_query = st.text_input(
     "キーワードを入力して検索",
     placeholder="例: timeout error, OutOfMemory, 503 ...",
+    key="search_query",
 )
 
 search_clicked = st.button("検索")
 
 # --- Total Record Count ---
+all_tables = partitions.all_tables(log_partitions)
 total_records = session.sql(
-    "SELECT COUNT(*) AS CNT FROM LOG_SEARCH_APP.PUBLIC.LOGS"
+    "SELECT SUM(CNT) AS CNT FROM ("
+    + " UNION ALL ".join(f"SELECT COUNT(*) AS CNT FROM {t}" for t in all_tables)
+    + ")"
 ).to_pandas()["CNT"][0]
-st.caption(f"対象テーブル: `LOG_SEARCH_APP.PUBLIC.LOGS` — 総レコード数: **{int(total_records):,}** 件")
+table_label = f"{TABLE_FQN}_YYYY_MM ({len(log_partitions)} partitions)" if log_partitions else TABLE_FQN
+st.caption(f"対象テーブル: `{table_label}` — 総レコード数: **{int(total_records):,}** 件")
 
 # --- Raw Data Preview ---
 with st.expander("元データを確認"):
     preview_limit = st.number_input("表示件数", min_value=1, max_value=10000, value=100, step=100)
-    raw_df = session.sql(
-        f"SELECT * FROM LOG_SEARCH_APP.PUBLIC.LOGS ORDER BY TIMESTAMP DESC LIMIT {int(preview_limit)}"
-    ).to_pandas()
+    preview_sql, _ = union_select(
+        all_tables, select_list(PREVIEW_CHARS), "TRUE", [],
+        order_by="TIMESTAMP DESC", limit=preview_limit,
+    )
+    raw_df = session.sql(preview_sql).to_pandas()
     st.dataframe(raw_df, use_container_width=True)
 
-# --- Build & Execute Query ---
-def build_query(search_text, severities, sources, start, end, mode, limit):
-    conditions = []
-    params = []
+# --- Alert Rules ---
+with st.expander("アラートルール"):
+    try:
+        rules = alerts.load_rules(session, enabled_only=False)
+        if rules:
+            for rule in rules:
+                col_rule, col_toggle = st.columns([4, 1])
+                filters = ", ".join(rule["SEVERITIES"] + rule["SOURCES"]) or "all"
+                col_rule.markdown(
+                    f"**{rule['NAME']}** — `{rule['SEARCH_TEXT'] or '*'}` ({rule['SEARCH_MODE']}, {filters}) "
+                    f"> {rule['THRESHOLD']:,} / {rule['WINDOW_MINUTES']} min — "
+                    f"watermark: {rule['WATERMARK'] or '-'}"
+                )
+                label = "Disable" if rule["ENABLED"] else "Enable"
+                if col_toggle.button(label, key=f"rule_toggle_{rule['RULE_ID']}"):
+                    alerts.set_rule_enabled(session, rule["RULE_ID"], not rule["ENABLED"])
+                    st.info("Updated. Please reload the page.")
+            st.markdown("**Recent alerts**")
+            st.dataframe(alerts.recent_events(session), use_container_width=True)
+        else:
+            st.caption("アラートルールはまだありません。サイドバーの「Saved Search / Alert」から作成できます。")
+    except Exception as e:
+        st.warning(f"Could not load alert rules: {e}")
+
+# --- Search Optimization Advisor ---
+with st.expander("Search Optimization Advisor"):
+    st.caption(
+        "このアプリの過去の検索（ACCOUNT_USAGE.QUERY_HISTORY、最大45分遅延）から、"
+        "レイテンシ・プルーニング・よく使われる条件を分析し、追加の最適化を提案します。"
+    )
+    advisor_table = st.selectbox("対象テーブル", all_tables, index=0)
+    if st.button("過去の検索を分析"):
+        try:
+            with st.spinner("Query history を分析中..."):
+                analysis = advisor.analyze(advisor.fetch_history(session))
+                st.session_state["advisor_analysis"] = analysis
+                st.session_state["advisor_recs"] = (
+                    advisor.recommend(session, analysis, advisor_table) if analysis else []
+                )
+        except Exception as e:
+            st.error(f"Failed to analyze query history: {e}")
+
+    analysis = st.session_state.get("advisor_analysis")
+    if "advisor_analysis" in st.session_state and analysis is None:
+        st.info("分析対象の検索履歴がありません。")
+    elif analysis is not None:
+        a1, a2, a3 = st.columns(3)
+        a1.metric("Searches", f"{analysis['queries']:,}")
+        a2.metric("Median latency", f"{analysis['median_ms']:,.0f} ms")
+        a3.metric("Avg partitions pruned", f"{analysis['pruned']:.0%}")
+
+        col_so, col_pred, col_mode = st.columns(3)
+        with col_so:
+            st.markdown("**With / without SO**")
+            st.dataframe(analysis["so_summary"], use_container_width=True)
+        with col_pred:
+            st.markdown("**Equality predicates**")
+            st.dataframe(analysis["predicates"], use_container_width=True)
+        with col_mode:
+            st.markdown("**SEARCH() modes**")
+            st.dataframe(analysis["modes"], use_container_width=True)
+
+        st.markdown("**Recommendations**")
+        recs = st.session_state.get("advisor_recs", [])
+        if not recs:
+            st.caption("追加の推奨事項はありません。")
+        for i, rec in enumerate(recs):
+            status = "推奨" if rec["recommended"] else "効果小"
+            st.markdown(f"- **{rec['title']}** ({status}) — {rec['reason']}。推定効果: {rec['benefit']}")
+            if rec["recommended"] and rec["sql"]:
+                st.code(rec["sql"], language="sql")
+                if st.button(f"Apply {rec['title']}", key=f"advisor_apply_{i}"):
+                    try:
+                        advisor.apply(session, rec)
+                        st.success("Applied. Building runs in the background.")
+                    except Exception as e:
+                        st.error(f"Failed to apply: {e}")
+
+# --- Compare (baseline vs incident) ---
+with st.expander("Compare: baseline vs incident"):
+    st.caption(
+        "現在の検索条件（キーワード・フィルタ）を、選択中の時間範囲（incident）とベースライン期間の両方で"
+        "サーバー側集計し、Source / Host / Severity / メッセージテンプレートごとに増減の大きい値を表示します。"
+    )
+    baseline_choice = st.selectbox("Baseline", list(compare.BASELINES), index=1)
+    baseline_range = compare.baseline_window(start_time, end_time, baseline_choice)
+    st.caption(
+        f"Incident: {start_time:%Y-%m-%d %H:%M} – {end_time:%Y-%m-%d %H:%M} / "
+        f"Baseline: {baseline_range[0]:%Y-%m-%d %H:%M} – {baseline_range[1]:%Y-%m-%d %H:%M}"
+    )
+    if st.button("比較する"):
+        compare_filters = {
+            "search_text": search_query, "severities": severities, "sources": selected_sources,
+            "mode": search_mode, "all_sources": all_sources, "fields": field_filters,
+        }
+        try:
+            with st.spinner("両期間を集計中..."):
+                counts = compare.fetch_counts(
+                    session, log_partitions, compare_filters, (start_time, end_time), baseline_range
+                )
+                st.session_state["compare_result"] = compare.movers(
+                    counts, (start_time, end_time), baseline_range
+                )
+        except Exception as e:
+            st.error(f"Failed to compare: {e}")
 
-    # Time range
-    conditions.append("TIMESTAMP BETWEEN ? AND ?")
-    params.append(start)
-    params.append(end)
-
-    # Severity
-    if severities and len(severities) < 5:
-        placeholders = ", ".join(["?"] * len(severities))
-        conditions.append(f"SEVERITY IN ({placeholders})")
-        params.extend(severities)
-
-    # Source
-    if sources and len(sources) < len(all_sources):
-        placeholders = ", ".join(["?"] * len(sources))
-        conditions.append(f"SOURCE IN ({placeholders})")
-        params.extend(sources)
-
-    # Full-text search
-    if search_text and search_text.strip():
-        conditions.append(
-            f"SEARCH((*), ?, SEARCH_MODE => '{mode}', ANALYZER => 'UNICODE_ANALYZER')"
+    compare_result = st.session_state.get("compare_result")
+    if compare_result is not None:
+        st.caption(
+            f"ratio = 期間長で正規化した件数比（incident / baseline）。"
+            f"significant = p < {compare.SIGNIFICANCE}（二項検定）"
         )
-        params.append(search_text.strip())
+        for dim in compare.DIMENSIONS:
+            st.markdown(f"**{dim.title()}**")
+            st.dataframe(compare_result[dim], use_container_width=True)
 
-    where_clause = " AND ".join(conditions)
-    query = f"""
-        SELECT LOG_ID, TIMESTAMP, SEVERITY, SOURCE, HOST, MESSAGE
-        FROM LOG_SEARCH_APP.PUBLIC.LOGS
-        WHERE {where_clause}
-        ORDER BY TIMESTAMP DESC
-        LIMIT {int(limit)}
-    """
-    return query, params
+# --- Execute Query ---
+if search_clicked:
+    def make_search_query(start):
+        query, params = build_query(
+            search_query, severities, selected_sources, start, end_time, search_mode, max_results,
+            all_sources=all_sources, tables=partitions.route(log_partitions, start, end_time),
+            preview_chars=PREVIEW_CHARS, fields=field_filters,
+        )
+        return tag_query(query, "search", so="on" if so_active else "off"), params
 
+    search_start = start_time
+    query, params = make_search_query(search_start)
 
-if search_clicked:
-    query, params = build_query(
-        search_query, severities, selected_sources, start_time, end_time, search_mode, max_results
-    )
+    # --- Cost estimate & warehouse routing ---
+    try:
+        estimate = sizing.explain(session, query, params)
+    except Exception as e:
+        estimate = None
+        st.caption(f"EXPLAIN failed, running on {sizing.WAREHOUSE}: {e}")
+
+    if estimate is not None and sizing.is_runaway(estimate):
+        if auto_narrow:
+            narrowed_start = sizing.narrow_start(start_time, end_time, estimate)
+            search_start = narrowed_start
+            query, params = make_search_query(search_start)
+            try:
+                estimate = sizing.explain(session, query, params)
+            except Exception as e:
+                estimate = None
+                st.caption(f"EXPLAIN failed, running on {sizing.WAREHOUSE}: {e}")
+            st.warning(
+                f"推定スキャン量が上限 {sizing.format_bytes(sizing.RUNAWAY_BYTES)} を超えるため、"
+                f"期間を {narrowed_start:%Y-%m-%d %H:%M} 以降に絞り込みました。"
+            )
+        else:
+            st.warning(
+                f"このクエリは推定 {sizing.format_bytes(estimate.bytes_assigned)} をスキャンします。"
+                f"時間範囲や条件を絞り込むことを検討してください。"
+            )
+
+    if estimate is not None:
+        plan = sizing.plan_execution(session, estimate)
+        st.caption(
+            f"Estimated scan: {estimate.partitions_assigned:,} / {estimate.partitions_total:,} partitions, "
+            f"{sizing.format_bytes(estimate.bytes_assigned)} — warehouse: **{plan.warehouse}**"
+            + (f" ({plan.size}, reverted after the search)" if plan.route == "upsize" else "")
+        )
+    else:
+        plan = sizing.Plan("default", sizing.WAREHOUSE, sizing.SMALL_SIZE, "no estimate")
 
-    df = session.sql(query, params=params).to_pandas()
+    facet_where, facet_params = build_where(
+        search_query, severities, selected_sources, search_start, end_time, search_mode,
+        all_sources, field_filters,
+    )
+    # The previous result's spill file is no longer needed
+    previous = st.session_state.pop("kw_results", None)
+    if isinstance(previous, governor.SpilledResult):
+        previous.close()
+
+    result_tables = partitions.route(log_partitions, search_start, end_time)
+    with sizing.run_on(session, plan):
+        # Results larger than the per-session memory budget go to a local columnar file
+        result_size = governor.estimate(session, result_tables, facet_where, facet_params, max_results)
+        if governor.fits(result_size):
+            result_table = results.fetch_arrow(session, query, params, columns=PREVIEW_COLUMNS)
+        else:
+            result_table = governor.fetch_spilled(session, query, params)
+        # Exact field facets over every match, not only the fetched rows
+        try:
+            field_facets = fields.facets(session, result_tables, facet_where, facet_params)
+        except Exception as e:
+            field_facets = None
+            st.caption(f"Field facets unavailable (FIELDS column not set up?), using fetched rows: {e}")
+
+    # Kept across reruns so loading full messages / exporting does not re-search
+    st.session_state["kw_results"] = result_table
+    st.session_state["kw_facets"] = field_facets
+    # Anomaly scores are reused while the same filters are searched again (only the time range moves)
+    st.session_state["kw_signature"] = (
+        search_query, search_mode, tuple(severities), tuple(selected_sources),
+        tuple(sorted(field_filters.items())), max_results,
+    )
+    st.session_state.pop("kw_drill", None)
+    st.session_state["kw_messages"] = governor.message_cache()
+    st.session_state.pop("kw_export", None)
+    st.session_state.pop("kw_export_parts", None)
+
+# --- Results ---
+if st.session_state.get("kw_results") is not None:
+    result_table = st.session_state["kw_results"]
+    full_messages = st.session_state.setdefault("kw_messages", governor.message_cache())
+
+    spilled = isinstance(result_table, governor.SpilledResult)
+    if spilled:
+        st.info(
+            f"結果が1セッションあたりのメモリ上限 {sizing.format_bytes(governor.MEMORY_BUDGET)} を超えるため、"
+            f"ローカルの圧縮列ファイル（{sizing.format_bytes(result_table.nbytes_on_disk)}）に退避しました。"
+            f"集計はファイルを順に読み、表示は {governor.PAGE_ROWS:,} 件ずつ読み込みます。"
+        )
 
     # --- Summary Metrics with severity color badges ---
-    total = len(df)
-    fatal_count = len(df[df["SEVERITY"] == "FATAL"]) if total > 0 else 0
-    error_count = len(df[df["SEVERITY"] == "ERROR"]) if total > 0 else 0
-    warn_count = len(df[df["SEVERITY"] == "WARN"]) if total > 0 else 0
-    info_count = len(df[df["SEVERITY"] == "INFO"]) if total > 0 else 0
-    debug_count = len(df[df["SEVERITY"] == "DEBUG"]) if total > 0 else 0
+    total = result_table.num_rows
+    sev_totals = results.severity_counts(result_table)
+    fatal_count = sev_totals["FATAL"]
+    error_count = sev_totals["ERROR"]
+    warn_count = sev_totals["WARN"]
+    info_count = sev_totals["INFO"]
+    debug_count = sev_totals["DEBUG"]
 
     m1, m2, m3, m4, m5, m6 = st.columns(6)
     m1.metric("Total", f"{total:,}")
@@ -377,7 +648,9 @@ if search_clicked:
     m6.metric("DEBUG", f"{debug_count:,}")
 
     # --- Tabbed Layout ---
-    df["TIMESTAMP"] = pd.to_datetime(df["TIMESTAMP"]) if total > 0 else df["TIMESTAMP"]
+    # Arrow-backed view of the rows the Details tab renders: TIMESTAMP is
+    # datetime64, MESSAGE stays an Arrow string buffer
+    df = results.to_frame(result_table.slice(0, 30))
 
     tab_charts, tab_events, tab_details = st.tabs(["Charts", "Events", "Details"])
 
@@ -388,25 +661,53 @@ if search_clicked:
 
             with col_chart:
                 st.subheader("Event Timeline")
-                df["hour_bucket"] = df["TIMESTAMP"].dt.floor("h")
-                timeline_df = (
-                    df.groupby(["hour_bucket", "SEVERITY"])
-                    .size()
-                    .reset_index(name="count")
+                timeline_pivot = results.timeline(result_table, unit="hour")
+                signature = st.session_state.get("kw_signature")
+                detector = st.session_state.get("kw_detector")
+                if detector is None or detector.key != signature:
+                    detector = anomaly.Detector(key=signature)
+                    st.session_state["kw_detector"] = detector
+                flagged = detector.update(timeline_pivot)
+
+                # Stacked severity bars with a red rule on every anomalous bucket
+                bars = alt.Chart(
+                    timeline_pivot.reset_index().melt("Time", var_name="Severity", value_name="Count")
+                ).mark_bar().encode(
+                    x="Time:T", y="sum(Count):Q",
+                    color=alt.Color("Severity:N", sort=list(timeline_pivot.columns)),
                 )
-                timeline_pivot = timeline_df.pivot_table(
-                    index="hour_bucket", columns="SEVERITY", values="count", fill_value=0
-                ).reset_index()
-                timeline_pivot = timeline_pivot.rename(columns={"hour_bucket": "Time"})
-                timeline_pivot = timeline_pivot.set_index("Time")
-                sev_order = [s for s in ["FATAL", "ERROR", "WARN", "INFO", "DEBUG"] if s in timeline_pivot.columns]
-                timeline_pivot = timeline_pivot[sev_order]
-                st.bar_chart(timeline_pivot)
+                rules = alt.Chart(flagged).mark_rule(color="red", strokeDash=[4, 2]).encode(
+                    x="Time:T", tooltip=["Time:T", "Severity:N", "Count:Q", "Expected:Q", "z:Q"],
+                )
+                st.altair_chart(bars + rules, use_container_width=True)
+
+                if len(flagged) > 0:
+                    st.caption(
+                        f"{len(flagged):,} anomalous bucket(s) (|robust z| ≥ {anomaly.THRESHOLD:g}, "
+                        f"vs. same hour in previous weeks/days)"
+                    )
+                    for i, a in flagged.head(10).iterrows():
+                        col_a, col_drill = st.columns([4, 1])
+                        col_a.markdown(
+                            f"**{a['Time']:%Y-%m-%d %H:00}** {a['Severity']}: {a['Count']:,.0f} "
+                            f"(expected {a['Expected']:,.1f}, z {a['z']:+.1f})"
+                        )
+                        if col_drill.button("Drill in", key=f"anomaly_{i}"):
+                            st.session_state["kw_drill"] = (a["Time"], a["Severity"])
+
+                drill = st.session_state.get("kw_drill")
+                if drill is not None:
+                    drill_time, drill_severity = drill
+                    bucket_rows = results.in_bucket(
+                        result_table, drill_time.to_pydatetime(),
+                        (drill_time + anomaly.BUCKET).to_pydatetime(), drill_severity,
+                    )
+                    st.markdown(f"**{drill_severity} events at {drill_time:%Y-%m-%d %H:00}** ({bucket_rows.num_rows:,})")
+                    st.dataframe(bucket_rows, use_container_width=True)
 
             with col_sources:
                 st.subheader("Top Sources")
-                source_counts = df["SOURCE"].value_counts().reset_index()
-                source_counts.columns = ["Source", "Count"]
+                source_counts = results.value_counts(result_table, "SOURCE", "Source")
                 st.bar_chart(source_counts.set_index("Source"))
 
             # --- Row 2: By Severity + Events by Host ---
@@ -414,53 +715,35 @@ if search_clicked:
 
             with col_sev:
                 st.subheader("By Severity")
-                sev_counts = df["SEVERITY"].value_counts().reset_index()
-                sev_counts.columns = ["Severity", "Count"]
+                sev_counts = results.value_counts(result_table, "SEVERITY", "Severity")
                 st.dataframe(sev_counts, use_container_width=True)
 
             with col_host:
                 st.subheader("Events by Host")
-                host_counts = df["HOST"].value_counts().reset_index()
-                host_counts.columns = ["Host", "Count"]
+                host_counts = results.value_counts(result_table, "HOST", "Host")
                 host_chart = host_counts.head(15).set_index("Host")
                 st.bar_chart(host_chart)
 
             # --- Row 3: Extracted Fields ---
             st.markdown("---")
             st.subheader("Extracted Fields")
-            st.caption("MESSAGEカラムから自動抽出されたフィールドの値分布（出現頻度順・上位15フィールド）")
-
-            # --- Generic key=value parser ---
-            all_kvs = df["MESSAGE"].str.extractall(r'([a-z_]+)=(\S+)')
-            extracted = {}
-            if len(all_kvs) > 0:
-                all_kvs.columns = ["key", "value"]
-                for key, grp in all_kvs.groupby("key"):
-                    top_vals = grp["value"].value_counts().head(10).reset_index()
-                    top_vals.columns = ["Value", "Count"]
-                    extracted[key] = top_vals
-
-            # --- Supplemental patterns for non key=value fields ---
-            special_patterns = {
-                "http_status": r'HTTP\s(\d{3})',
-                "timeout_ms": r'after\s(\d+)ms',
-                "retry_attempt": r'attempt\s(\d+)',
-            }
-            for field_name, pattern in special_patterns.items():
-                if field_name not in extracted:
-                    vals = df["MESSAGE"].str.extract(pattern, expand=False).dropna()
-                    if len(vals) > 0:
-                        top_vals = vals.value_counts().head(10).reset_index()
-                        top_vals.columns = ["Value", "Count"]
-                        extracted[field_name] = top_vals
+            extracted = st.session_state.get("kw_facets")
+            if extracted is not None:
+                st.caption(
+                    "検索条件に一致する全行の FIELDS カラム（取り込み時に抽出）から集計したフィールドの値分布"
+                    "（出現頻度順・上位15フィールド）"
+                )
+            else:
+                st.caption(
+                    f"取得した結果の MESSAGE 先頭{PREVIEW_CHARS}文字から抽出したフィールドの値分布"
+                    "（出現頻度順・上位15フィールド）"
+                )
+                sample = result_table.slice(0, governor.PAGE_ROWS) if spilled else result_table
+                extracted = fields.facets_from_messages(sample.column("MESSAGE").to_pylist())
 
             if extracted:
-                # Sort fields by total occurrence count (descending), limit to top 15
-                sorted_fields = sorted(
-                    extracted.keys(),
-                    key=lambda k: extracted[k]["Count"].sum(),
-                    reverse=True,
-                )[:15]
+                # Already ordered by total occurrence count (descending), top 15
+                sorted_fields = list(extracted)
 
                 # Display in 3-column layout
                 for i in range(0, len(sorted_fields), 3):
@@ -481,10 +764,50 @@ if search_clicked:
     with tab_events:
         if total > 0:
             st.subheader(f"Log Events ({total:,} results)")
-            display_df = df[["TIMESTAMP", "SEVERITY", "SOURCE", "HOST", "MESSAGE"]].copy()
-            display_df["TIMESTAMP"] = display_df["TIMESTAMP"].dt.strftime("%Y-%m-%d %H:%M:%S")
-            display_df.columns = ["Time", "Severity", "Source", "Host", "Message"]
-            st.dataframe(display_df, use_container_width=True)
+            page = 0
+            page_table = result_table
+            if spilled:
+                pages = (total + governor.PAGE_ROWS - 1) // governor.PAGE_ROWS
+                page = st.number_input(f"Page (1–{pages:,})", min_value=1, max_value=pages, value=1) - 1
+                # Only the stored batches overlapping this page are read from the file
+                page_table = result_table.slice(page * governor.PAGE_ROWS, governor.PAGE_ROWS)
+            # Column selection on the Arrow table is zero-copy
+            display_table = page_table.select(
+                ["TIMESTAMP", "SEVERITY", "SOURCE", "HOST", "MESSAGE", "MESSAGE_LENGTH"]
+            ).rename_columns(["Time", "Severity", "Source", "Host", "Message", "Length"])
+            st.dataframe(display_table, use_container_width=True)
+            st.caption(f"Message は先頭 {PREVIEW_CHARS} 文字のみ表示しています。全文は CSV エクスポートに含まれます。")
+
+            # The export is built one part at a time so its full messages stay within EXPORT_BYTES
+            export_parts = st.session_state.get("kw_export_parts")
+            if export_parts is None:
+                export_parts = st.session_state["kw_export_parts"] = governor.export_parts(result_table)
+            part = 0
+            if len(export_parts) > 1:
+                part = st.selectbox(
+                    "Export part", range(len(export_parts)),
+                    format_func=lambda i: f"{export_parts[i][0] + 1:,}–{sum(export_parts[i]):,}",
+                )
+                st.caption(
+                    f"CSV は {governor.EXPORT_ROWS:,} 行、またはメッセージ全文 "
+                    f"{sizing.format_bytes(governor.EXPORT_BYTES)} ごとに分割して作成します。"
+                )
+            if st.button("CSVを作成（メッセージ全文）"):
+                with st.spinner("メッセージ全文を取得中..."):
+                    offset, length = export_parts[part]
+                    st.session_state.pop("kw_export", None)
+                    export_table = results.with_full_messages(
+                        session, result_table.slice(offset, length), log_partitions,
+                    )
+                    st.session_state["kw_export"] = (part, results.to_frame(export_table).to_csv(index=False))
+                    del export_table
+            export = st.session_state.get("kw_export")
+            if export is not None and export[0] == part:
+                st.download_button(
+                    "Download CSV", export[1],
+                    file_name=f"log_search_results_{part + 1}.csv" if len(export_parts) > 1 else "log_search_results.csv",
+                    mime="text/csv",
+                )
         else:
             st.caption("No log events found. Try adjusting your search query or filters.")
 
@@ -492,17 +815,62 @@ if search_clicked:
     with tab_details:
         if total > 0:
             st.subheader("Log Details")
-            st.caption("Expand a row to see the full log message:")
-            for _, row in df.head(30).iterrows():
+            st.caption("Expand a row to see the log message:")
+            detail_rows = df.head(30)
+            truncated = detail_rows[
+                (detail_rows["MESSAGE_LENGTH"] > detail_rows["MESSAGE"].str.len())
+                & ~detail_rows["LOG_ID"].isin(list(full_messages))
+            ]
+            if len(truncated) > 0 and st.button(f"Load full messages ({len(truncated)} truncated)"):
+                # One batched lookup by LOG_ID for every truncated row on screen
+                full_messages.update(results.fetch_messages(
+                    session, truncated["LOG_ID"].tolist(), truncated["TIMESTAMP"].tolist(), log_partitions,
+                ))
+
+            # --- Surrounding logs (cached per session, keyed by LOG_ID / key / rows) ---
+            col_ctx_by, col_ctx_rows = st.columns(2)
+            context_by = col_ctx_by.selectbox("Context by", context.CONTEXT_KEYS, index=0)
+            context_rows = col_ctx_rows.number_input(
+                "Rows before / after", min_value=1, max_value=200, value=context.CONTEXT_ROWS,
+            )
+            context_cache = st.session_state.setdefault("kw_context", governor.context_cache())
+
+            def load_context(rows_df):
+                anchors = [
+                    {
+                        "LOG_ID": int(r["LOG_ID"]),
+                        "TIMESTAMP": r["TIMESTAMP"].to_pydatetime(),
+                        context_by: r[context_by],
+                    }
+                    for _, r in rows_df.iterrows()
+                    if (int(r["LOG_ID"]), context_by, context_rows) not in context_cache
+                ]
+                if anchors:
+                    fetched = context.fetch_context(
+                        session, anchors, log_partitions, by=context_by, rows=context_rows
+                    )
+                    for log_id, hood in fetched.items():
+                        context_cache[(log_id, context_by, context_rows)] = hood
+
+            # Top hits are fetched up front in one query so opening them is instant
+            try:
+                load_context(detail_rows.head(context.PREFETCH))
+            except Exception as e:
+                st.caption(f"Context prefetch failed: {e}")
+
+            for _, row in detail_rows.iterrows():
                 sev = row["SEVERITY"]
                 sev_class = sev.lower()
                 ts = row["TIMESTAMP"].strftime("%Y-%m-%d %H:%M:%S")
                 badge = f'<span class="sev-badge sev-{sev_class}">{sev}</span>'
+                message = full_messages.get(row["LOG_ID"], row["MESSAGE"])
+                if len(message) < row["MESSAGE_LENGTH"]:
+                    message = f"{message} … ({row['MESSAGE_LENGTH']:,} chars)"
                 with st.expander(f"[{sev}] {ts} | {row['SOURCE']} | {str(row['MESSAGE'])[:80]}"):
                     st.markdown(
                         f'<div class="detail-card {sev_class}">'
                         f'{badge} <strong>{ts}</strong>'
-                        f'<pre style="white-space:pre-wrap;margin:0.5rem 0;">{row["MESSAGE"]}</pre>'
+                        f'<pre style="white-space:pre-wrap;margin:0.5rem 0;">{message}</pre>'
                         f'<div class="detail-meta">'
                         f'Host: <code>{row["HOST"]}</code> &nbsp; '
                         f'Source: <code>{row["SOURCE"]}</code> &nbsp; '
@@ -510,6 +878,14 @@ if search_clicked:
                         f'</div></div>',
                         unsafe_allow_html=True
                     )
+                    context_key = (int(row["LOG_ID"]), context_by, context_rows)
+                    if context_key not in context_cache:
+                        if st.button("Show surrounding logs", key=f"context_{row['LOG_ID']}"):
+                            with st.spinner("Loading surrounding logs..."):
+                                load_context(detail_rows[detail_rows["LOG_ID"] == row["LOG_ID"]])
+                    if context_key in context_cache:
+                        st.markdown(f"**Surrounding logs** (same {context_by}, ±{context_rows} rows)")
+                        st.dataframe(context.mark_anchor(context_cache[context_key]), use_container_width=True)
         else:
             st.caption("No log events found. Try adjusting your search query or filters.")
 
@@ -585,7 +961,7 @@ Snowflake Search Optimization Service をサイドバーから管理できます
 st.subheader("技術情報")
 st.markdown("""
 - **対象テーブル**: `LOG_SEARCH_APP.PUBLIC.LOGS`
-- **検索関数**: `SEARCH((*), ?, SEARCH_MODE => '...', ANALYZER => 'UNICODE_ANALYZER')`
+- **検索関数**: `SEARCH((SEVERITY, SOURCE, HOST, MESSAGE), ?, SEARCH_MODE => '...', ANALYZER => 'UNICODE_ANALYZER')`
 - **インデックス種類**: Search Optimization Service（`FULL_TEXT` メソッド）
 - **アナライザー**: `UNICODE_ANALYZER`（大文字小文字を区別しない、Unicode対応のトークン分割）
 """)
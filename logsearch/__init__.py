@@ -0,0 +1 @@
+"""Shared helpers for the Log Search Streamlit pages and background jobs."""
@@ -0,0 +1,189 @@
+"""Search Optimization advisor driven by this app's past searches.
+
+Searches run by the Keyword Search page carry a ``/* log_search_app kind=search
+so=on|off */`` comment (see ``query.tag_query``), so their entries in
+``SNOWFLAKE.ACCOUNT_USAGE.QUERY_HISTORY`` can be analyzed for latency, pruning
+and which predicates / SEARCH() modes dominate. Recommendations combine that
+workload profile with the table's clustering metadata to estimate how many
+partitions each extra search access path would let Snowflake skip.
+"""
+
+import json
+import re
+
+import pandas as pd
+
+from logsearch.query import QUERY_TAG
+
+HISTORY_DAYS = 14
+# Minimum share of searches using a predicate before it is worth an access path
+MIN_PREDICATE_SHARE = 0.1
+MIN_TEXT_SEARCH_SHARE = 0.2
+# Below this estimated skip ratio an EQUALITY method is not worth its cost
+MIN_EQUALITY_SKIP = 0.3
+# Above this depth / partition ratio the table is effectively unclustered on TIMESTAMP
+MAX_TIMESTAMP_DEPTH_RATIO = 0.05
+
+EQUALITY_COLUMNS = ["SEVERITY", "SOURCE", "HOST"]
+PREDICATE_PATTERNS = {col: rf"\b{col}\s*(?:=|IN\s*\()" for col in EQUALITY_COLUMNS}
+SEARCH_MODE_PATTERN = r"SEARCH_MODE\s*=>\s*'(\w+)'"
+
+
+def fetch_history(session, days=HISTORY_DAYS):
+    """Tagged search queries from ACCOUNT_USAGE (up to ~45 min latency)."""
+    return session.sql(
+        """
+        SELECT QUERY_ID, START_TIME, TOTAL_ELAPSED_TIME, PARTITIONS_SCANNED, PARTITIONS_TOTAL,
+               BYTES_SCANNED, WAREHOUSE_SIZE, QUERY_TEXT
+        FROM SNOWFLAKE.ACCOUNT_USAGE.QUERY_HISTORY
+        WHERE START_TIME >= DATEADD('day', -?, CURRENT_TIMESTAMP())
+          AND EXECUTION_STATUS = 'SUCCESS'
+          AND STARTSWITH(QUERY_TEXT, ?)
+        ORDER BY START_TIME DESC
+        LIMIT 10000
+        """,
+        params=[int(days), f"/* {QUERY_TAG} kind=search"],
+    ).to_pandas()
+
+
+def analyze(history):
+    """Summarize latency, pruning and predicate usage of the tagged searches."""
+    if len(history) == 0:
+        return None
+
+    text = history["QUERY_TEXT"].astype(str)
+    total = history["PARTITIONS_TOTAL"].astype(float)
+    df = pd.DataFrame({
+        "elapsed_ms": history["TOTAL_ELAPSED_TIME"].astype(float),
+        "bytes_scanned": history["BYTES_SCANNED"].astype(float),
+        "pruned": 1 - history["PARTITIONS_SCANNED"].astype(float) / total.where(total > 0),
+        "so": text.str.extract(r"\bso=(on|off)\b", expand=False).fillna("unknown"),
+        "mode": text.str.extract(SEARCH_MODE_PATTERN, flags=re.IGNORECASE, expand=False).fillna("(none)"),
+    })
+    for col, pattern in PREDICATE_PATTERNS.items():
+        df[col] = text.str.contains(pattern, flags=re.IGNORECASE, regex=True)
+
+    so_summary = df.groupby("so").agg(
+        queries=("elapsed_ms", "size"),
+        median_ms=("elapsed_ms", "median"),
+        p90_ms=("elapsed_ms", lambda s: s.quantile(0.9)),
+        pruned_pct=("pruned", lambda s: s.mean() * 100),
+        avg_mb_scanned=("bytes_scanned", lambda s: s.mean() / 1e6),
+    ).reset_index()
+
+    predicates = pd.DataFrame([
+        {
+            "column": col,
+            "share": df[col].mean(),
+            "median_ms": df.loc[df[col], "elapsed_ms"].median() if df[col].any() else None,
+        }
+        for col in EQUALITY_COLUMNS
+    ])
+
+    modes = df["mode"].value_counts(normalize=True).rename_axis("mode").reset_index(name="share")
+
+    return {
+        "queries": len(df),
+        "median_ms": df["elapsed_ms"].median(),
+        "pruned": df["pruned"].mean(),
+        "text_search_share": (df["mode"] != "(none)").mean(),
+        "so_summary": so_summary,
+        "predicates": predicates,
+        "modes": modes,
+    }
+
+
+def _clustering_info(session, table, expression):
+    raw = session.sql(
+        "SELECT SYSTEM$CLUSTERING_INFORMATION(?, ?) AS INFO", params=[table, f"({expression})"]
+    ).collect()[0]["INFO"]
+    return json.loads(raw)
+
+
+def current_methods(session, table):
+    """Set of (method, target) pairs from DESCRIBE SEARCH OPTIMIZATION."""
+    try:
+        rows = session.sql(f"DESCRIBE SEARCH OPTIMIZATION ON {table}").collect()
+    except Exception:
+        return set()
+    methods = set()
+    for row in rows:
+        row = row.as_dict()
+        method = row.get("method", row.get('"method"'))
+        target = row.get("target", row.get('"target"'))
+        methods.add((str(method).upper(), str(target).upper()))
+    return methods
+
+
+def recommend(session, analysis, table):
+    """Return recommendation dicts: title, sql, reason, benefit, recommended."""
+    methods = current_methods(session, table)
+    recommendations = []
+
+    # --- FULL_TEXT on MESSAGE ---
+    has_full_text = any(m == "FULL_TEXT" and "MESSAGE" in t for m, t in methods)
+    if not has_full_text and analysis["text_search_share"] >= MIN_TEXT_SEARCH_SHARE:
+        so = analysis["so_summary"].set_index("so")
+        if "on" in so.index and "off" in so.index and so.loc["on", "median_ms"] > 0:
+            benefit = f"median {so.loc['off', 'median_ms']:,.0f} ms → {so.loc['on', 'median_ms']:,.0f} ms (past searches with SO)"
+        else:
+            benefit = f"{analysis['text_search_share']:.0%} of searches use SEARCH(); token lookups avoid full scans"
+        recommendations.append({
+            "title": "FULL_TEXT(MESSAGE)",
+            "sql": f"ALTER TABLE {table} ADD SEARCH OPTIMIZATION ON FULL_TEXT(MESSAGE, ANALYZER => 'UNICODE_ANALYZER')",
+            "reason": f"{analysis['text_search_share']:.0%} of searches call SEARCH()",
+            "benefit": benefit,
+            "recommended": True,
+        })
+
+    # --- EQUALITY on filter columns ---
+    timestamp_info = _clustering_info(session, table, "TIMESTAMP")
+    total_partitions = max(int(timestamp_info.get("total_partition_count", 0)), 1)
+    equality_columns = []
+    for _, pred in analysis["predicates"].iterrows():
+        col = pred["column"]
+        if pred["share"] < MIN_PREDICATE_SHARE:
+            continue
+        if any(m == "EQUALITY" and col in t for m, t in methods):
+            continue
+        # Partitions overlapping one value ~ clustering depth on that column
+        depth = float(_clustering_info(session, table, col).get("average_depth", total_partitions))
+        skip = max(0.0, 1 - depth / total_partitions)
+        recommendations.append({
+            "title": f"EQUALITY({col})",
+            "sql": None,
+            "reason": f"{pred['share']:.0%} of searches filter on {col}",
+            "benefit": f"~{skip:.0%} of partitions skippable per {col} filter (avg depth {depth:,.1f} / {total_partitions:,})",
+            "recommended": skip >= MIN_EQUALITY_SKIP,
+            "column": col,
+        })
+        if skip >= MIN_EQUALITY_SKIP:
+            equality_columns.append(col)
+
+    if equality_columns:
+        # One ALTER covering every worthwhile column, e.g. EQUALITY(SOURCE, HOST)
+        sql = f"ALTER TABLE {table} ADD SEARCH OPTIMIZATION ON EQUALITY({', '.join(equality_columns)})"
+        for rec in recommendations:
+            if rec.get("column") in equality_columns:
+                rec["sql"] = sql
+
+    # --- Clustering key on TIMESTAMP ---
+    depth = float(timestamp_info.get("average_depth", 1))
+    clustering_key = str(timestamp_info.get("cluster_by_keys", "") or "")
+    if "TIMESTAMP" not in clustering_key.upper() and depth / total_partitions > MAX_TIMESTAMP_DEPTH_RATIO:
+        recommendations.append({
+            "title": "CLUSTER BY (TIMESTAMP)",
+            "sql": f"ALTER TABLE {table} CLUSTER BY (DATE_TRUNC('HOUR', TIMESTAMP))",
+            "reason": (
+                f"every search filters on TIMESTAMP but pruning averages {analysis['pruned']:.0%}; "
+                f"average depth is {depth:,.1f} of {total_partitions:,} partitions"
+            ),
+            "benefit": f"~{1 - 1 / max(depth, 1):.0%} fewer partitions scanned for time-range searches (plus Automatic Clustering cost)",
+            "recommended": True,
+        })
+
+    return recommendations
+
+
+def apply(session, recommendation):
+    session.sql(recommendation["sql"]).collect()
@@ -0,0 +1,272 @@
+"""Saved searches and threshold alert rules, evaluated incrementally.
+
+Each alert rule points at a saved search and says "more than THRESHOLD matches
+per WINDOW_MINUTES". The evaluator only scans rows newer than each rule's
+WATERMARK, and rules whose saved searches share the same filters are answered
+by a single aggregated scan, so the cost of a run follows the amount of new
+data rather than (number of rules x lookback).
+
+Runs either inside Snowflake (``run`` is the stored-procedure handler called by
+a TASK) or as a local process::
+
+    python -m logsearch.alerts --connection default --interval 60
+"""
+
+import json
+import math
+import time
+from datetime import datetime, timedelta
+
+from logsearch import partitions as log_partitions
+from logsearch.query import DB, SCHEMA, build_predicates, union_select
+
+SAVED_SEARCHES_FQN = f"{DB}.{SCHEMA}.SAVED_SEARCHES"
+ALERT_RULES_FQN = f"{DB}.{SCHEMA}.ALERT_RULES"
+ALERT_EVENTS_FQN = f"{DB}.{SCHEMA}.ALERT_EVENTS"
+
+# Rows may land a little after their TIMESTAMP; windows ending inside this
+# grace period are left for the next run instead of being evaluated early.
+DEFAULT_GRACE_MINUTES = 2
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+# --- Saved-search store ---
+def save_search(session, name, search_text, mode, severities, sources):
+    """Insert a saved search and return its SEARCH_ID."""
+    session.sql(
+        f"""
+        INSERT INTO {SAVED_SEARCHES_FQN} (NAME, SEARCH_TEXT, SEARCH_MODE, SEVERITIES, SOURCES)
+        SELECT ?, ?, ?, PARSE_JSON(?), PARSE_JSON(?)
+        """,
+        params=[name, search_text or "", mode, json.dumps(list(severities)), json.dumps(list(sources))],
+    ).collect()
+    row = session.sql(
+        f"SELECT MAX(SEARCH_ID) AS SEARCH_ID FROM {SAVED_SEARCHES_FQN} WHERE NAME = ?",
+        params=[name],
+    ).collect()[0]
+    return row["SEARCH_ID"]
+
+
+def add_rule(session, search_id, window_minutes, threshold):
+    session.sql(
+        f"""
+        INSERT INTO {ALERT_RULES_FQN} (SEARCH_ID, WINDOW_MINUTES, THRESHOLD)
+        SELECT ?, ?, ?
+        """,
+        params=[int(search_id), int(window_minutes), int(threshold)],
+    ).collect()
+
+
+def set_rule_enabled(session, rule_id, enabled):
+    session.sql(
+        f"UPDATE {ALERT_RULES_FQN} SET ENABLED = ? WHERE RULE_ID = ?",
+        params=[bool(enabled), int(rule_id)],
+    ).collect()
+
+
+def load_rules(session, enabled_only=True):
+    """Return alert rules joined with their saved-search definitions as dicts."""
+    where = "WHERE r.ENABLED" if enabled_only else ""
+    rows = session.sql(
+        f"""
+        SELECT r.RULE_ID, r.WINDOW_MINUTES, r.THRESHOLD, r.ENABLED, r.WATERMARK,
+               s.SEARCH_ID, s.NAME, s.SEARCH_TEXT, s.SEARCH_MODE, s.SEVERITIES, s.SOURCES
+        FROM {ALERT_RULES_FQN} r
+        JOIN {SAVED_SEARCHES_FQN} s ON s.SEARCH_ID = r.SEARCH_ID
+        {where}
+        ORDER BY r.RULE_ID
+        """
+    ).collect()
+    rules = []
+    for row in rows:
+        rule = row.as_dict()
+        rule["SEVERITIES"] = _json_list(rule["SEVERITIES"])
+        rule["SOURCES"] = _json_list(rule["SOURCES"])
+        rules.append(rule)
+    return rules
+
+
+def recent_events(session, limit=50):
+    return session.sql(
+        f"""
+        SELECT e.FIRED_AT, s.NAME, e.WINDOW_START, e.WINDOW_END, e.EVENT_COUNT, e.THRESHOLD
+        FROM {ALERT_EVENTS_FQN} e
+        JOIN {ALERT_RULES_FQN} r ON r.RULE_ID = e.RULE_ID
+        JOIN {SAVED_SEARCHES_FQN} s ON s.SEARCH_ID = r.SEARCH_ID
+        ORDER BY e.FIRED_AT DESC, e.WINDOW_START DESC
+        LIMIT {int(limit)}
+        """
+    ).to_pandas()
+
+
+def _json_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return json.loads(value)
+    return list(value)
+
+
+# --- Window arithmetic ---
+def _floor(ts, minutes):
+    """Floor ``ts`` to a multiple of ``minutes`` since 1970-01-01 (TIME_SLICE alignment)."""
+    elapsed = int((ts - _EPOCH).total_seconds() // 60)
+    return _EPOCH + timedelta(minutes=elapsed - elapsed % minutes)
+
+
+def _filter_key(rule):
+    return (
+        (rule["SEARCH_TEXT"] or "").strip(),
+        rule["SEARCH_MODE"],
+        tuple(sorted(rule["SEVERITIES"])),
+        tuple(sorted(rule["SOURCES"])),
+    )
+
+
+def _rule_range(rule, eval_end):
+    """Half-open [start, end) of complete windows not yet evaluated for ``rule``."""
+    window = int(rule["WINDOW_MINUTES"])
+    end = _floor(eval_end, window)
+    start = rule["WATERMARK"]
+    if start is None:
+        # First evaluation: look at the last complete window only, no backfill.
+        start = end - timedelta(minutes=window)
+    return start, end
+
+
+# --- Evaluation ---
+def evaluate_rules(session, rules=None, now=None, grace_minutes=DEFAULT_GRACE_MINUTES):
+    """Evaluate every due rule over its delta and persist alerts and watermarks.
+
+    Returns the list of fired alert dicts.
+    """
+    if rules is None:
+        rules = load_rules(session)
+    if now is None:
+        now = session.sql("SELECT CURRENT_TIMESTAMP()::TIMESTAMP_NTZ AS NOW").collect()[0]["NOW"]
+    eval_end = now - timedelta(minutes=grace_minutes)
+
+    groups = {}
+    for rule in rules:
+        start, end = _rule_range(rule, eval_end)
+        if end <= start:
+            continue
+        groups.setdefault(_filter_key(rule), []).append((rule, start, end))
+
+    partitions = log_partitions.list_partitions(session) if groups else []
+    fired = []
+    watermarks = []
+    for (search_text, mode, severities, sources), members in groups.items():
+        # One scan per distinct filter set, bucketed at the GCD of the member
+        # windows so every rule's windows are exact unions of buckets.
+        bucket_minutes = 0
+        for rule, _, _ in members:
+            bucket_minutes = math.gcd(bucket_minutes, int(rule["WINDOW_MINUTES"]))
+        scan_start = min(start for _, start, _ in members)
+        scan_end = max(end for _, _, end in members)
+
+        conditions, params = build_predicates(search_text, list(severities), list(sources), mode)
+        conditions = ["TIMESTAMP >= ?", "TIMESTAMP < ?"] + conditions
+        params = [scan_start, scan_end] + params
+        tables = log_partitions.route(partitions, scan_start, scan_end)
+        matches, params = union_select(tables, "TIMESTAMP", " AND ".join(conditions), params)
+        rows = session.sql(
+            f"""
+            SELECT TIME_SLICE(TIMESTAMP, {bucket_minutes}, 'MINUTE') AS BUCKET, COUNT(*) AS CNT
+            FROM ({matches})
+            GROUP BY BUCKET
+            """,
+            params=params,
+        ).collect()
+        buckets = [(row["BUCKET"], row["CNT"]) for row in rows]
+
+        for rule, start, end in members:
+            window = int(rule["WINDOW_MINUTES"])
+            counts = {}
+            for bucket, cnt in buckets:
+                if start <= bucket < end:
+                    window_start = _floor(bucket, window)
+                    counts[window_start] = counts.get(window_start, 0) + cnt
+            for window_start in sorted(counts):
+                if counts[window_start] > rule["THRESHOLD"]:
+                    fired.append({
+                        "RULE_ID": rule["RULE_ID"],
+                        "NAME": rule["NAME"],
+                        "WINDOW_START": window_start,
+                        "WINDOW_END": window_start + timedelta(minutes=window),
+                        "EVENT_COUNT": counts[window_start],
+                        "THRESHOLD": rule["THRESHOLD"],
+                    })
+            watermarks.append((rule["RULE_ID"], end))
+
+    _record(session, fired, watermarks)
+    return fired
+
+
+def _record(session, fired, watermarks):
+    """Persist fired alerts and advance watermarks in one statement each."""
+    if fired:
+        values = ", ".join(["(?, ?, ?, ?, ?)"] * len(fired))
+        params = []
+        for event in fired:
+            params.extend([
+                event["RULE_ID"], event["WINDOW_START"], event["WINDOW_END"],
+                event["EVENT_COUNT"], event["THRESHOLD"],
+            ])
+        session.sql(
+            f"""
+            INSERT INTO {ALERT_EVENTS_FQN} (RULE_ID, WINDOW_START, WINDOW_END, EVENT_COUNT, THRESHOLD)
+            VALUES {values}
+            """,
+            params=params,
+        ).collect()
+
+    if watermarks:
+        values = ", ".join(["(?, ?)"] * len(watermarks))
+        params = []
+        for rule_id, watermark in watermarks:
+            params.extend([rule_id, watermark])
+        session.sql(
+            f"""
+            UPDATE {ALERT_RULES_FQN} r
+            SET WATERMARK = v.WATERMARK
+            FROM (SELECT column1 AS RULE_ID, column2::TIMESTAMP_NTZ AS WATERMARK
+                  FROM VALUES {values}) v
+            WHERE r.RULE_ID = v.RULE_ID
+            """,
+            params=params,
+        ).collect()
+
+
+# --- Entry points ---
+def run(session):
+    """Stored-procedure handler used by the ALERT_EVALUATION_TASK."""
+    fired = evaluate_rules(session)
+    return f"{len(fired)} alert(s) fired"
+
+
+def main():
+    import argparse
+    from snowflake.snowpark import Session
+
+    parser = argparse.ArgumentParser(description="Evaluate log alert rules on a schedule.")
+    parser.add_argument("--connection", default="default", help="connection name in connections.toml")
+    parser.add_argument("--interval", type=int, default=60, help="seconds between runs")
+    parser.add_argument("--once", action="store_true", help="evaluate once and exit")
+    args = parser.parse_args()
+
+    session = Session.builder.config("connection_name", args.connection).create()
+    while True:
+        for event in evaluate_rules(session):
+            print(
+                f"[ALERT] {event['NAME']}: {event['EVENT_COUNT']} events "
+                f"in {event['WINDOW_START']} - {event['WINDOW_END']} (> {event['THRESHOLD']})"
+            )
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Baseline-vs-incident comparison of two time windows, aggregated in Snowflake.
+
+The current search filters are applied to both windows, and a single
+``GROUP BY GROUPING SETS`` query counts the matches of each window per SOURCE,
+HOST, SEVERITY and message template. Only those counts come back, never raw
+rows. Per dimension value the incident rate is compared with the baseline rate
+(window lengths as exposure) using a conditional binomial test, so "top
+movers" are ranked by how surprising the change is rather than by raw ratio.
+The same score picks the values kept per dimension, after both windows are
+counted, so every value returned has its real count in both.
+"""
+
+import math
+from datetime import timedelta
+
+import pandas as pd
+
+from logsearch import partitions
+from logsearch.query import TEMPLATE_SQL, build_where, tag_query, union_select
+
+DIMENSIONS = ["SOURCE", "HOST", "SEVERITY", "TEMPLATE"]
+BASELINES = {
+    "Previous window": None,
+    "Same window yesterday": timedelta(days=1),
+    "Same window last week": timedelta(days=7),
+}
+# Most significant values kept per dimension
+MAX_VALUES = 1000
+SIGNIFICANCE = 0.001
+
+
+def baseline_window(start, end, baseline):
+    """(start, end) of the baseline for the incident window [start, end]."""
+    shift = BASELINES[baseline]
+    if shift is None:
+        shift = end - start
+    return start - shift, end - shift
+
+
+def _incident_share(incident, baseline):
+    """p0: the incident window's share of the combined window length."""
+    incident_seconds = (incident[1] - incident[0]).total_seconds()
+    baseline_seconds = (baseline[1] - baseline[0]).total_seconds()
+    return incident_seconds, baseline_seconds, incident_seconds / (incident_seconds + baseline_seconds)
+
+
+def _compare_query(log_partitions, filters, incident, baseline):
+    windows, params = [], []
+    for flag, (start, end) in (("TRUE", incident), ("FALSE", baseline)):
+        where_clause, where_params = build_where(start=start, end=end, **filters)
+        matches, where_params = union_select(
+            partitions.route(log_partitions, start, end),
+            f"SOURCE, HOST, SEVERITY, {TEMPLATE_SQL} AS TEMPLATE",
+            where_clause, where_params,
+        )
+        windows.append(f"SELECT {flag} AS INCIDENT, SOURCE, HOST, SEVERITY, TEMPLATE FROM ({matches})")
+        params.extend(where_params)
+    p0 = _incident_share(incident, baseline)[2]
+    dims = ", ".join(f"({d})" for d in DIMENSIONS)
+    labels = " ".join(f"WHEN GROUPING({d}) = 0 THEN '{d}'" for d in DIMENSIONS)
+    values = ", ".join(f"{d}::VARCHAR" for d in DIMENSIONS)
+    # |z| of the binomial test in ``movers``, so truncation keeps the values it would rank first
+    n = "(CNT_INCIDENT + CNT_BASELINE)"
+    z = f"ABS(CNT_INCIDENT - {n} * {p0!r}) / SQRT({n} * {p0 * (1 - p0)!r})"
+    query = f"""
+        WITH matches AS (
+            {" UNION ALL ".join(windows)}
+        ),
+        counts AS (
+            SELECT CASE {labels} END AS DIMENSION,
+                   COALESCE({values}) AS VALUE,
+                   COUNT_IF(INCIDENT) AS CNT_INCIDENT,
+                   COUNT_IF(NOT INCIDENT) AS CNT_BASELINE
+            FROM matches
+            GROUP BY GROUPING SETS ({dims})
+        )
+        SELECT DIMENSION, VALUE, CNT_INCIDENT, CNT_BASELINE
+        FROM counts
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY DIMENSION ORDER BY {z} DESC, {n} DESC) <= {MAX_VALUES}
+    """
+    return tag_query(query, "compare"), params
+
+
+def fetch_counts(session, log_partitions, filters, incident, baseline):
+    """Counts per dimension value in both windows (DIMENSION, VALUE, CNT_INCIDENT, CNT_BASELINE)."""
+    rows = session.sql(*_compare_query(log_partitions, filters, incident, baseline)).collect()
+    return pd.DataFrame(
+        [(r["DIMENSION"], r["VALUE"], r["CNT_INCIDENT"], r["CNT_BASELINE"]) for r in rows],
+        columns=["DIMENSION", "VALUE", "CNT_INCIDENT", "CNT_BASELINE"],
+    )
+
+
+def movers(counts, incident, baseline, top=10):
+    """Per dimension, the ``top`` values whose rate changed most significantly.
+
+    Under "no change" the incident share of a value's combined count follows
+    Binomial(n, p0) with p0 = incident length / (incident + baseline length).
+    """
+    incident_seconds, baseline_seconds, p0 = _incident_share(incident, baseline)
+
+    df = counts.copy()
+    a = df["CNT_INCIDENT"].astype(float)
+    b = df["CNT_BASELINE"].astype(float)
+    n = a + b
+    df["ratio"] = ((a + 0.5) / incident_seconds) / ((b + 0.5) / baseline_seconds)
+    df["z"] = (a - n * p0) / (n * p0 * (1 - p0)).pow(0.5)
+    df["p_value"] = df["z"].abs().map(lambda z: math.erfc(z / math.sqrt(2)))
+    df["significant"] = df["p_value"] < SIGNIFICANCE
+
+    result = {}
+    for dim in DIMENSIONS:
+        part = df[df["DIMENSION"] == dim]
+        part = part.reindex(part["z"].abs().sort_values(ascending=False).index).head(top)
+        result[dim] = part.rename(columns={
+            "VALUE": "Value", "CNT_BASELINE": "Baseline", "CNT_INCIDENT": "Incident",
+        })[["Value", "Baseline", "Incident", "ratio", "z", "p_value", "significant"]].reset_index(drop=True)
+    return result
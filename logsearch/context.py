@@ -0,0 +1,94 @@
+"""Surrounding logs ("context") for individual search hits.
+
+For an anchor row the context is the N rows logged just before and after it by
+the same HOST (or SOURCE), ordered by ``(TIMESTAMP, LOG_ID)``. Each side is its
+own ``ORDER BY TIMESTAMP ... LIMIT N`` branch bounded to ``MAX_WINDOW_MINUTES``
+around the anchor, so the scan prunes to the micro-partitions next to the hit
+and a quiet side (e.g. after the newest hit) costs no extra round trips.
+Every side of several anchors is one ``UNION ALL`` statement, which is how the
+page prefetches the top visible hits.
+"""
+
+from datetime import timedelta
+
+import pyarrow.compute as pc
+
+from logsearch import partitions
+from logsearch.query import PREVIEW_CHARS, PREVIEW_COLUMNS, select_list, union_select
+from logsearch.results import fetch_arrow
+
+CONTEXT_KEYS = ["HOST", "SOURCE"]
+CONTEXT_ROWS = 20
+# Furthest a neighbor may be from its anchor, on either side
+MAX_WINDOW_MINUTES = 24 * 60
+# Number of top hits whose context is fetched before it is asked for
+PREFETCH = 5
+
+CONTEXT_COLUMNS = ["ANCHOR_ID", "SIDE"] + PREVIEW_COLUMNS
+
+# SIDE: -1 before the anchor, 0 the anchor itself, 1 after it
+_SIDES = {
+    -1: ("(TIMESTAMP < ? OR (TIMESTAMP = ? AND LOG_ID < ?))", "TIMESTAMP DESC, LOG_ID DESC"),
+    0: ("TIMESTAMP = ? AND LOG_ID = ?", None),
+    1: ("(TIMESTAMP > ? OR (TIMESTAMP = ? AND LOG_ID > ?))", "TIMESTAMP ASC, LOG_ID ASC"),
+}
+
+
+def _side_query(anchor, log_partitions, by, rows, side, window):
+    log_id, ts = int(anchor["LOG_ID"]), anchor["TIMESTAMP"]
+    start = ts - window if side < 0 else ts
+    end = ts + window if side > 0 else ts
+    condition, order_by = _SIDES[side]
+    side_params = [ts, log_id] if side == 0 else [ts, ts, log_id]
+    return union_select(
+        partitions.route(log_partitions, start, end),
+        f"{log_id} AS ANCHOR_ID, {side} AS SIDE, {select_list(PREVIEW_CHARS)}",
+        f"{by} = ? AND TIMESTAMP BETWEEN ? AND ? AND {condition}",
+        [str(anchor[by]), start, end] + side_params,
+        order_by=order_by,
+        limit=rows if side else 1,
+    )
+
+
+def _neighbor_query(anchors, log_partitions, by, rows, window_minutes):
+    window = timedelta(minutes=window_minutes)
+    branches, params = [], []
+    for anchor in anchors:
+        for side in _SIDES:
+            query, side_params = _side_query(anchor, log_partitions, by, rows, side, window)
+            branches.append(f"SELECT * FROM ({query})")
+            params.extend(side_params)
+    return "\nUNION ALL\n".join(branches), params
+
+
+def fetch_context(session, anchors, log_partitions=None, by="HOST", rows=CONTEXT_ROWS,
+                  window_minutes=MAX_WINDOW_MINUTES):
+    """Return {anchor LOG_ID: Arrow table of its neighborhood} for ``anchors``.
+
+    ``anchors`` are row dicts with LOG_ID, TIMESTAMP and the ``by`` column.
+    Each table holds up to ``rows`` rows on either side (within
+    ``window_minutes``) plus the anchor, ordered by (TIMESTAMP, LOG_ID), with a
+    SIDE column (-1 / 0 / 1). All anchors are answered by a single query.
+    """
+    if by not in CONTEXT_KEYS:
+        raise ValueError(f"by must be one of {CONTEXT_KEYS}")
+    if not anchors:
+        return {}
+    query, params = _neighbor_query(anchors, log_partitions or [], by, rows, window_minutes)
+    table = fetch_arrow(session, query, params, columns=CONTEXT_COLUMNS)
+    context = {}
+    for anchor in anchors:
+        log_id = int(anchor["LOG_ID"])
+        hood = table.filter(pc.equal(table.column("ANCHOR_ID"), log_id)) if table.num_rows else table
+        context[log_id] = hood.drop(["ANCHOR_ID"]).sort_by(
+            [("TIMESTAMP", "ascending"), ("LOG_ID", "ascending")]
+        )
+    return context
+
+
+def mark_anchor(table):
+    """Prepend a marker column that points at the anchor row."""
+    if table.num_rows == 0:
+        return table.drop(["SIDE"])
+    marker = pc.if_else(pc.equal(table.column("SIDE"), 0), "▶", "")
+    return table.drop(["SIDE"]).add_column(0, "", marker)
@@ -0,0 +1,187 @@
+"""Corpus for the Cortex Search Service: one representative row per log stratum.
+
+Rows are grouped into strata of (SOURCE, SEVERITY, message template, day),
+where the template is MESSAGE with numbers, hex values and UUIDs collapsed
+(``query.TEMPLATE_SQL``), so exact and near-duplicate messages fall into the
+same stratum. Every stratum is kept in LOGS_SMALL_STRATA with its newest row as
+representative plus DUPLICATE_COUNT / FIRST_SEEN / LAST_SEEN. LOGS_SMALL, the
+table the service embeds, takes representatives from those strata up to
+``CORPUS_ROWS``:
+
+- every template first gets its newest day, then its next newest, and so on
+  (at most ``MAX_PER_TEMPLATE`` days), so one chatty template cannot crowd out
+  rare ones;
+- within the same round, higher severities and rarer templates come first.
+
+``build`` creates both tables from scratch. ``run`` (the REFRESH_LOG_CORPUS
+TASK) reads the rows appended since the last run from an append-only stream
+per log table, adds them to the stratum counts and only inserts
+representatives for strata that are new. Counts never touch LOGS_SMALL, so a
+refresh re-embeds just the newly added rows.
+"""
+
+import json
+
+from logsearch import partitions
+from logsearch.query import (
+    DB, RESULT_COLUMNS, SCHEMA, SEVERITIES, TEMPLATE_SQL, list_streams, stream_name, union_select,
+)
+
+CORPUS_FQN = f"{DB}.{SCHEMA}.LOGS_SMALL"
+STRATA_FQN = f"{DB}.{SCHEMA}.LOGS_SMALL_STRATA"
+
+CORPUS_ROWS = 100000
+MAX_PER_TEMPLATE = 30
+# Time stratum of a representative
+BUCKET = "DAY"
+# Representatives of brand-new templates a refresh may add even when the corpus
+# is already at CORPUS_ROWS, so templates first seen after a build get indexed.
+REFRESH_ROWS = 1000
+
+CORPUS_COLUMNS = RESULT_COLUMNS + ["TEMPLATE_ID", "BUCKET"]
+STRATA_COLUMNS = CORPUS_COLUMNS + ["DUPLICATE_COUNT", "FIRST_SEEN", "LAST_SEEN"]
+
+STREAM_KIND = "CORPUS"
+
+SEVERITY_RANK_SQL = (
+    "CASE SEVERITY "
+    + " ".join(f"WHEN '{s}' THEN {i}" for i, s in enumerate(SEVERITIES))
+    + f" ELSE {len(SEVERITIES)} END"
+)
+
+
+def _strata_query(sources):
+    """One row per stratum of the rows in ``sources`` (tables, streams or AT clauses)."""
+    logs, params = union_select(sources, ", ".join(RESULT_COLUMNS), "TRUE", [])
+    by = "PARTITION BY TEMPLATE_ID, BUCKET"
+    query = f"""
+        SELECT {", ".join(CORPUS_COLUMNS)},
+               COUNT(*) OVER ({by}) AS DUPLICATE_COUNT,
+               MIN(TIMESTAMP) OVER ({by}) AS FIRST_SEEN,
+               MAX(TIMESTAMP) OVER ({by}) AS LAST_SEEN
+        FROM (
+            SELECT {", ".join(RESULT_COLUMNS)},
+                   HASH(SOURCE, SEVERITY, {TEMPLATE_SQL}) AS TEMPLATE_ID,
+                   DATE_TRUNC('{BUCKET}', TIMESTAMP) AS BUCKET
+            FROM ({logs})
+        )
+        QUALIFY ROW_NUMBER() OVER ({by} ORDER BY TIMESTAMP DESC, LOG_ID DESC) = 1
+    """
+    return query, params
+
+
+def _selection_query(limit, incremental):
+    """Representatives to add to the corpus, best first, at most ``limit`` rows.
+
+    With ``incremental`` the strata already in LOGS_SMALL are skipped and the
+    days a template already has there count towards MAX_PER_TEMPLATE; templates
+    without any representative yet get one beyond ``limit`` (up to REFRESH_ROWS).
+    """
+    reps, new_template, existing = "0", "FALSE", ""
+    if incremental:
+        reps = "COALESCE(r.REPS, 0)"
+        new_template = "r.REPS IS NULL"
+        existing = f"""
+            LEFT JOIN (SELECT TEMPLATE_ID, COUNT(*) AS REPS FROM {CORPUS_FQN} GROUP BY 1) r
+              ON r.TEMPLATE_ID = s.TEMPLATE_ID
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {CORPUS_FQN} c
+                WHERE c.TEMPLATE_ID = s.TEMPLATE_ID AND c.BUCKET = s.BUCKET
+            )
+        """
+    order_by = f"ORDER BY REP_RANK, {SEVERITY_RANK_SQL}, TEMPLATE_COUNT, BUCKET DESC"
+    return f"""
+        WITH strata AS (
+            SELECT *, SUM(DUPLICATE_COUNT) OVER (PARTITION BY TEMPLATE_ID) AS TEMPLATE_COUNT
+            FROM {STRATA_FQN}
+        ),
+        candidates AS (
+            SELECT s.*, {new_template} AS NEW_TEMPLATE,
+                   {reps} + ROW_NUMBER() OVER (PARTITION BY s.TEMPLATE_ID ORDER BY s.BUCKET DESC) AS REP_RANK
+            FROM strata s
+            {existing}
+        )
+        SELECT {", ".join(CORPUS_COLUMNS)}
+        FROM candidates
+        WHERE REP_RANK <= {MAX_PER_TEMPLATE}
+        QUALIFY ROW_NUMBER() OVER ({order_by}) <= {int(limit)}
+             OR (NEW_TEMPLATE AND REP_RANK = 1 AND ROW_NUMBER() OVER ({order_by}) <= {REFRESH_ROWS})
+    """
+
+
+def _corpus_rows(session):
+    return int(session.sql(f"SELECT COUNT(*) FROM {CORPUS_FQN}").collect()[0][0])
+
+
+def build(session, rows=CORPUS_ROWS):
+    """(Re)create the streams, LOGS_SMALL_STRATA and LOGS_SMALL from every log table.
+
+    Replacing LOGS_SMALL makes the Cortex Search Service re-embed the whole
+    corpus; routine updates go through ``run`` instead.
+    """
+    tables = partitions.all_tables(partitions.list_partitions(session, refresh=True))
+    # Streams first, and the build reads each table as of its stream's offset,
+    # so every row is counted exactly once between the build and later refreshes.
+    for table in tables:
+        session.sql(f"CREATE OR REPLACE STREAM {stream_name(table, STREAM_KIND)} ON TABLE {table} APPEND_ONLY = TRUE").collect()
+    strata, params = _strata_query([f"{t} AT(STREAM => '{stream_name(t, STREAM_KIND)}')" for t in tables])
+    session.sql(f"CREATE OR REPLACE TABLE {STRATA_FQN} AS {strata}", params=params).collect()
+    session.sql(
+        f"CREATE OR REPLACE TABLE {CORPUS_FQN} CHANGE_TRACKING = TRUE AS "
+        f"{_selection_query(rows, incremental=False)}"
+    ).collect()
+    return f"{_corpus_rows(session)} representative(s) built"
+
+
+def run(session, rows=CORPUS_ROWS):
+    """Stored-procedure handler used by the REFRESH_LOG_CORPUS TASK."""
+    tables = partitions.all_tables(partitions.list_partitions(session, refresh=True))
+    streams = list_streams(session, STREAM_KIND)
+    for table in tables:
+        # Tables added after the build contribute from now on
+        if stream_name(table, STREAM_KIND) not in streams:
+            session.sql(f"CREATE STREAM IF NOT EXISTS {stream_name(table, STREAM_KIND)} ON TABLE {table} APPEND_ONLY = TRUE").collect()
+    strata, params = _strata_query([stream_name(t, STREAM_KIND) for t in tables])
+    session.sql(
+        f"""
+        MERGE INTO {STRATA_FQN} t
+        USING ({strata}) s
+        ON t.TEMPLATE_ID = s.TEMPLATE_ID AND t.BUCKET = s.BUCKET
+        WHEN MATCHED THEN UPDATE SET
+            DUPLICATE_COUNT = t.DUPLICATE_COUNT + s.DUPLICATE_COUNT,
+            FIRST_SEEN = LEAST(t.FIRST_SEEN, s.FIRST_SEEN),
+            LAST_SEEN = GREATEST(t.LAST_SEEN, s.LAST_SEEN)
+        WHEN NOT MATCHED THEN INSERT ({", ".join(STRATA_COLUMNS)})
+            VALUES ({", ".join(f"s.{c}" for c in STRATA_COLUMNS)})
+        """,
+        params=params,
+    ).collect()
+    limit = max(rows - _corpus_rows(session), 0)
+    inserted = session.sql(
+        f"INSERT INTO {CORPUS_FQN} ({', '.join(CORPUS_COLUMNS)}) {_selection_query(limit, incremental=True)}"
+    ).collect()[0][0]
+    return f"{int(inserted)} representative(s) added"
+
+
+def occurrences(session, log_ids):
+    """{LOG_ID: (occurrences, first_seen, last_seen)} of each representative's template."""
+    if not log_ids:
+        return {}
+    rows = session.sql(
+        f"""
+        WITH ids AS (
+            SELECT VALUE::NUMBER AS LOG_ID FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?)))
+        )
+        SELECT c.LOG_ID, SUM(s.DUPLICATE_COUNT) AS OCCURRENCES,
+               MIN(s.FIRST_SEEN) AS FIRST_SEEN, MAX(s.LAST_SEEN) AS LAST_SEEN
+        FROM {CORPUS_FQN} c
+        JOIN ids ON ids.LOG_ID = c.LOG_ID
+        JOIN {STRATA_FQN} s ON s.TEMPLATE_ID = c.TEMPLATE_ID
+        GROUP BY c.LOG_ID
+        """,
+        params=[json.dumps([int(i) for i in log_ids])],
+    ).collect()
+    return {
+        int(r["LOG_ID"]): (int(r["OCCURRENCES"]), r["FIRST_SEEN"], r["LAST_SEEN"])
+        for r in rows
+    }
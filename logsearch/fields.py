@@ -0,0 +1,175 @@
+"""Structured fields parsed out of MESSAGE at write time into ``FIELDS VARIANT``.
+
+``extract_fields`` turns a message into a flat ``{field: value}`` object using
+the same rules the Extracted Fields panel used to apply per search
+(``key=value`` pairs plus HTTP status / timeout / retry patterns). It runs:
+
+- in ``logsearch.ingest`` workers, so bulk-loaded rows arrive with FIELDS set;
+- as the Python UDF ``EXTRACT_FIELDS(MESSAGE)``, applied by ``run`` (the
+  REFRESH_LOG_FIELDS TASK) to rows that reach a log table any other way, read
+  from an append-only stream per table.
+
+With FIELDS populated, facets are exact ``GROUP BY`` counts over every match
+(``facets``) and ``field=value`` filters become ``FIELDS:"field"::VARCHAR = ?``
+predicates that an ``EQUALITY(FIELDS)`` search access path can serve.
+"""
+
+import re
+
+from logsearch import partitions
+from logsearch.query import DB, SCHEMA, list_streams, stream_name, union_select
+
+KV_PATTERN = re.compile(r"([a-z_]+)=(\S+)")
+# Supplemental patterns for fields that are not written as key=value
+SPECIAL_PATTERNS = {
+    "http_status": re.compile(r"HTTP\s(\d{3})"),
+    "timeout_ms": re.compile(r"after\s(\d+)ms"),
+    "retry_attempt": re.compile(r"attempt\s(\d+)"),
+}
+# Bounds on what one message can contribute to its FIELDS object
+MAX_FIELDS = 50
+MAX_VALUE_CHARS = 200
+
+EXTRACT_UDF = f"{DB}.{SCHEMA}.EXTRACT_FIELDS"
+
+
+def extract_fields(message):
+    """Return ``{field: value}`` for ``message`` (first occurrence of each key wins)."""
+    fields = {}
+    if not message:
+        return fields
+    for key, value in KV_PATTERN.findall(message):
+        if len(fields) >= MAX_FIELDS:
+            break
+        fields.setdefault(key, value[:MAX_VALUE_CHARS])
+    for name, pattern in SPECIAL_PATTERNS.items():
+        if name not in fields:
+            m = pattern.search(message)
+            if m:
+                fields[name] = m.group(1)
+    return fields
+
+
+def parse_filters(text):
+    """Parse ``"http_status=503 service=api"`` into ``{"http_status": "503", ...}``."""
+    filters = {}
+    for token in (text or "").split():
+        key, sep, value = token.partition("=")
+        if not sep or not key or not value:
+            raise ValueError(f"Field filters must look like field=value: {token}")
+        filters[key] = value
+    return filters
+
+
+# --- Facets ---
+def facets(session, tables, where_clause, params, top_fields=15, top_values=10):
+    """Exact value counts per field over every row matching ``where_clause``.
+
+    Returns {field: DataFrame[Value, Count]} ordered by the field's total
+    occurrences, keeping the ``top_values`` most frequent values per field.
+    """
+    matches, params = union_select(tables, "FIELDS", where_clause, params)
+    df = session.sql(
+        f"""
+        WITH counts AS (
+            SELECT f.KEY AS FIELD, f.VALUE::VARCHAR AS VALUE, COUNT(*) AS CNT
+            FROM ({matches}) m, LATERAL FLATTEN(INPUT => m.FIELDS) f
+            GROUP BY 1, 2
+        ),
+        ranked AS (
+            SELECT FIELD, VALUE, CNT,
+                   SUM(CNT) OVER (PARTITION BY FIELD) AS FIELD_TOTAL,
+                   ROW_NUMBER() OVER (PARTITION BY FIELD ORDER BY CNT DESC, VALUE) AS VALUE_RANK
+            FROM counts
+        )
+        SELECT FIELD, VALUE, CNT, FIELD_TOTAL
+        FROM ranked
+        WHERE VALUE_RANK <= {int(top_values)}
+        QUALIFY DENSE_RANK() OVER (ORDER BY FIELD_TOTAL DESC, FIELD) <= {int(top_fields)}
+        ORDER BY FIELD_TOTAL DESC, FIELD, CNT DESC
+        """,
+        params=params,
+    ).to_pandas()
+    extracted = {}
+    for field, grp in df.groupby("FIELD", sort=False):
+        extracted[field] = grp[["VALUE", "CNT"]].rename(
+            columns={"VALUE": "Value", "CNT": "Count"}
+        ).reset_index(drop=True)
+    return extracted
+
+
+def facets_from_messages(messages, top_fields=15, top_values=10):
+    """Same shape as ``facets``, computed locally from already fetched messages."""
+    import pandas as pd
+
+    pairs = [(key, value) for m in messages for key, value in extract_fields(m).items()]
+    if not pairs:
+        return {}
+    df = pd.DataFrame(pairs, columns=["FIELD", "Value"])
+    totals = df["FIELD"].value_counts().head(top_fields)
+    return {
+        field: df.loc[df["FIELD"] == field, "Value"].value_counts().head(top_values)
+        .rename_axis("Value").reset_index(name="Count")
+        for field in totals.index
+    }
+
+
+# --- Write-time pipeline ---
+STREAM_KIND = "FIELDS"
+
+
+def _with_data(session, tables):
+    """Subset of ``tables`` whose stream holds unconsumed rows (no warehouse scan)."""
+    if not tables:
+        return []
+    checks = ", ".join(f"SYSTEM$STREAM_HAS_DATA('{stream_name(t, STREAM_KIND)}')" for t in tables)
+    row = session.sql(f"SELECT {checks}").collect()[0]
+    return [t for t, has_data in zip(tables, row) if has_data]
+
+
+def ensure_pipeline(session, table):
+    """Add FIELDS and the append-only stream to ``table``; backfill on first setup."""
+    if stream_name(table, STREAM_KIND) in list_streams(session, STREAM_KIND):
+        return False
+    session.sql(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS FIELDS VARIANT").collect()
+    # Stream first, so rows inserted while backfilling are still picked up later.
+    session.sql(f"CREATE STREAM IF NOT EXISTS {stream_name(table, STREAM_KIND)} ON TABLE {table} APPEND_ONLY = TRUE").collect()
+    session.sql(f"UPDATE {table} SET FIELDS = {EXTRACT_UDF}(MESSAGE) WHERE FIELDS IS NULL").collect()
+    return True
+
+
+def apply_stream(session, table):
+    """Fill FIELDS for the rows appended since the last run; returns rows updated."""
+    row = session.sql(
+        f"""
+        MERGE INTO {table} t
+        USING (
+            SELECT LOG_ID, TIMESTAMP, {EXTRACT_UDF}(MESSAGE) AS FIELDS
+            FROM {stream_name(table, STREAM_KIND)}
+            WHERE FIELDS IS NULL
+        ) s
+        ON t.LOG_ID = s.LOG_ID AND t.TIMESTAMP = s.TIMESTAMP
+        WHEN MATCHED AND t.FIELDS IS NULL THEN UPDATE SET FIELDS = s.FIELDS
+        """
+    ).collect()[0]
+    return int(row[0])
+
+
+def run(session):
+    """Stored-procedure handler used by the REFRESH_LOG_FIELDS TASK.
+
+    Tables are set up once; afterwards only tables whose stream has new rows
+    are merged, so idle ticks do not scan anything.
+    """
+    tables = partitions.all_tables(partitions.list_partitions(session, refresh=True))
+    streams = list_streams(session, STREAM_KIND)
+    ready = []
+    for table in tables:
+        if stream_name(table, STREAM_KIND) in streams:
+            ready.append(table)
+        else:
+            ensure_pipeline(session, table)
+    updated = 0
+    for table in _with_data(session, ready):
+        updated += apply_stream(session, table)
+    return f"{updated} row(s) updated"
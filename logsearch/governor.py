@@ -0,0 +1,235 @@
+"""Per-session memory budget for search results, with spill to local Arrow files.
+
+Before a search runs, its result size is estimated from the row count and the
+average (preview) MESSAGE length. Results that fit the budget are held in
+memory as before. Larger ones are streamed batch by batch into a compressed
+Arrow IPC file in a temporary directory; ``SpilledResult`` memory-maps that
+file and reads only the batches a page or an aggregation needs, so the peak
+footprint stays around one record batch whatever ``max_results`` is.
+
+The rest of ``MEMORY_BUDGET`` is split between the per-session caches of full
+messages and surrounding logs (``BoundedCache``) and one CSV export, which is
+built for one part of the result at a time (``export_parts``).
+"""
+
+import os
+import shutil
+import tempfile
+import weakref
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
+
+import pyarrow as pa
+
+from logsearch.query import PREVIEW_CHARS, PREVIEW_COLUMNS, tag_query, union_select
+from logsearch.results import normalize
+
+MEMORY_BUDGET = 256 * 1024 ** 2   # bytes one session may hold in memory
+# Shares of MEMORY_BUDGET; search results get what is left
+MESSAGE_CACHE_BYTES = 16 * 1024 ** 2
+CONTEXT_CACHE_BYTES = 16 * 1024 ** 2
+EXPORT_BYTES = 32 * 1024 ** 2
+RESULT_BUDGET = MEMORY_BUDGET - MESSAGE_CACHE_BYTES - CONTEXT_CACHE_BYTES - EXPORT_BYTES
+# Fixed columns per row (LOG_ID, TIMESTAMP, MESSAGE_LENGTH, SEVERITY/SOURCE/HOST, offsets)
+ROW_OVERHEAD = 96
+# Measured with 200k preview rows: fetch_arrow peaks at ~1.2x the final table
+# while it concatenates, and st.dataframe serializes another full copy to
+# Arrow IPC; the rest is headroom for the pandas slices.
+MEMORY_FACTOR = 3
+PAGE_ROWS = 1000
+# Rows per CSV export part (fewer when their full messages exceed EXPORT_BYTES)
+EXPORT_ROWS = 50000
+SPILL_COMPRESSION = "zstd"
+
+SizeEstimate = namedtuple("SizeEstimate", ["rows", "matches", "bytes", "exact"])
+
+
+def estimate(session, tables, where_clause, params, limit):
+    """Expected in-memory size of a search result.
+
+    A search whose worst case (``limit`` rows with full previews) fits the
+    budget is not queried; otherwise COUNT(*) and the average preview length
+    of the matches are fetched.
+    """
+    worst = int(limit) * (ROW_OVERHEAD + PREVIEW_CHARS) * MEMORY_FACTOR
+    if worst <= RESULT_BUDGET:
+        return SizeEstimate(rows=int(limit), matches=None, bytes=worst, exact=False)
+    matches, params = union_select(tables, "MESSAGE", where_clause, params)
+    row = session.sql(
+        tag_query(
+            f"""
+            SELECT COUNT(*) AS MATCHES, AVG(LEAST(LENGTH(MESSAGE), {PREVIEW_CHARS})) AS AVG_CHARS
+            FROM ({matches})
+            """,
+            "estimate",
+        ),
+        params=params,
+    ).collect()[0]
+    rows = min(int(limit), int(row["MATCHES"]))
+    avg_chars = float(row["AVG_CHARS"] or 0)
+    return SizeEstimate(
+        rows=rows,
+        matches=int(row["MATCHES"]),
+        bytes=int(rows * (ROW_OVERHEAD + avg_chars) * MEMORY_FACTOR),
+        exact=True,
+    )
+
+
+def fits(size, budget=RESULT_BUDGET):
+    return size.bytes <= budget
+
+
+class BoundedCache(OrderedDict):
+    """Dict that evicts its least recently used entries beyond ``max_bytes``."""
+
+    def __init__(self, max_bytes, sizeof):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        if key in self:
+            self.nbytes -= self.sizeof(super().__getitem__(key))
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        self.nbytes += self.sizeof(value)
+        while self.nbytes > self.max_bytes and len(self) > 1:
+            _, evicted = self.popitem(last=False)
+            self.nbytes -= self.sizeof(evicted)
+
+    def update(self, other=(), **kwargs):
+        for key, value in dict(other, **kwargs).items():
+            self[key] = value
+
+
+def message_cache():
+    return BoundedCache(MESSAGE_CACHE_BYTES, lambda message: len(message or ""))
+
+
+def context_cache():
+    return BoundedCache(CONTEXT_CACHE_BYTES, lambda table: table.nbytes)
+
+
+def export_parts(table, max_rows=EXPORT_ROWS, max_bytes=EXPORT_BYTES):
+    """(offset, length) parts of ``table`` whose full messages fit ``max_bytes``.
+
+    Sizes come from the MESSAGE_LENGTH column, so no message is fetched to
+    plan the parts. A single row larger than ``max_bytes`` is a part of its own.
+    """
+    parts = []
+    start = rows = size = 0
+    offset = 0
+    for batch in (table.to_batches(["MESSAGE_LENGTH"]) if isinstance(table, SpilledResult)
+                  else [table.select(["MESSAGE_LENGTH"])]):
+        for length in batch.column("MESSAGE_LENGTH").to_pylist():
+            length = (length or 0) + ROW_OVERHEAD
+            if rows and (rows >= max_rows or size + length > max_bytes):
+                parts.append((start, rows))
+                start, rows, size = offset, 0, 0
+            rows += 1
+            size += length
+            offset += 1
+    if rows:
+        parts.append((start, rows))
+    return parts
+
+
+# --- Spilled results ---
+class SpilledResult:
+    """Read-only result stored in a local Arrow IPC file, read lazily through mmap.
+
+    Offers the parts of the ``pyarrow.Table`` interface the page uses:
+    ``num_rows``, ``column_names``, ``slice`` and ``to_batches``.
+    """
+
+    def __init__(self, directory, path, offsets, schema):
+        self.directory = directory
+        self.path = path
+        self._offsets = offsets   # first row of each batch, plus the total row count
+        self.schema = schema
+        self._cleanup = weakref.finalize(self, shutil.rmtree, directory, True)
+
+    @property
+    def num_rows(self):
+        return self._offsets[-1]
+
+    @property
+    def column_names(self):
+        return self.schema.names
+
+    @property
+    def nbytes_on_disk(self):
+        return os.path.getsize(self.path)
+
+    def _reader(self):
+        return pa.ipc.open_file(pa.memory_map(self.path, "r"))
+
+    def to_batches(self, columns=None):
+        """Yield one small ``pyarrow.Table`` per stored batch."""
+        reader = self._reader()
+        for i in range(reader.num_record_batches):
+            batch = pa.Table.from_batches([reader.get_batch(i)])
+            yield batch.select(columns) if columns else batch
+
+    def slice(self, offset=0, length=None):
+        """Rows [offset, offset + length) as an in-memory table."""
+        end = self.num_rows if length is None else min(self.num_rows, offset + length)
+        if offset >= end:
+            return self.schema.empty_table()
+        reader = self._reader()
+        first = bisect_right(self._offsets, offset) - 1
+        parts = []
+        i = first
+        while i < reader.num_record_batches and self._offsets[i] < end:
+            parts.append(reader.get_batch(i))
+            i += 1
+        table = pa.Table.from_batches(parts, schema=self.schema)
+        return table.slice(offset - self._offsets[first], end - offset)
+
+    def close(self):
+        self._cleanup()
+
+
+def fetch_spilled(session, query, params=None, columns=PREVIEW_COLUMNS):
+    """Run ``query`` and stream its Arrow batches into a compressed local file.
+
+    An empty result comes back as an empty in-memory table.
+    """
+    directory = tempfile.mkdtemp(prefix="logsearch_spill_")
+    path = os.path.join(directory, "result.arrow")
+    offsets = [0]
+    schema = None
+    writer = None
+    try:
+        cursor = session.connection.cursor()
+        try:
+            cursor.execute(query, params)
+            for batch in cursor.fetch_arrow_batches():
+                batch = normalize(batch)
+                if writer is None:
+                    schema = batch.schema
+                    options = pa.ipc.IpcWriteOptions(compression=SPILL_COMPRESSION)
+                    writer = pa.ipc.new_file(path, schema, options=options)
+                for record_batch in batch.to_batches():
+                    writer.write_batch(record_batch)
+                    offsets.append(offsets[-1] + record_batch.num_rows)
+        finally:
+            cursor.close()
+            if writer is not None:
+                writer.close()
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    if writer is None:
+        shutil.rmtree(directory, ignore_errors=True)
+        return pa.table({name: pa.array([], type=pa.string()) for name in columns})
+    return SpilledResult(directory, path, offsets, schema)
@@ -0,0 +1,534 @@
+"""Bulk loader for real log files into LOG_SEARCH_APP.PUBLIC.LOGS and its partitions.
+
+Files are streamed in line chunks, parsed into the
+``TIMESTAMP / SEVERITY / SOURCE / HOST / MESSAGE`` schema by a process pool,
+given their ``FIELDS`` object (``logsearch.fields``), written as
+Snappy-compressed Parquet parts, uploaded with parallel PUTs while
+parsing continues, and finally bulk-loaded with a single ``COPY INTO``.
+When monthly partitions exist (``logsearch.partitions``) the COPY goes to a
+temporary table and one multi-table INSERT sends every row to the partition
+of its month, or to LOGS if that month has none::
+
+    python -m logsearch.ingest --connection default /var/log/app/*.log.gz
+
+Supported input formats (``--format auto`` picks one per file):
+
+- ``jsonl``  - one JSON object per line (``timestamp``/``level``/``message``...)
+- ``syslog`` - RFC 3164 (``<34>Oct 11 22:14:15 host app[123]: msg``) and RFC 5424
+- ``app``    - ``2024-05-01 12:00:00,123 ERROR [source] message`` style lines,
+  with indented / unmatched lines folded into the previous record (stack traces)
+
+TIMESTAMP holds session-local time, like ``CURRENT_TIMESTAMP()`` in the rest of
+the app: timestamps with an offset and epoch values are converted to the
+session's TIMEZONE (or ``--timezone``), timestamps without one are kept as is.
+
+Requires ``pyarrow`` locally; it is not needed by the Streamlit pages.
+"""
+
+import glob
+import gzip
+import json
+import os
+import queue
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from logsearch import partitions as log_partitions
+from logsearch.fields import extract_fields
+from logsearch.query import DB, SCHEMA, TABLE_FQN, show_value
+
+COLUMNS = ["TIMESTAMP", "SEVERITY", "SOURCE", "HOST", "MESSAGE"]
+FORMATS = ["auto", "jsonl", "syslog", "app"]
+
+SEVERITY_ALIASES = {
+    "FATAL": "FATAL", "CRITICAL": "FATAL", "CRIT": "FATAL", "EMERG": "FATAL",
+    "EMERGENCY": "FATAL", "ALERT": "FATAL", "PANIC": "FATAL",
+    "ERROR": "ERROR", "ERR": "ERROR", "SEVERE": "ERROR",
+    "WARN": "WARN", "WARNING": "WARN",
+    "INFO": "INFO", "NOTICE": "INFO", "INFORMATIONAL": "INFO",
+    "DEBUG": "DEBUG", "TRACE": "DEBUG", "FINE": "DEBUG", "FINER": "DEBUG", "FINEST": "DEBUG",
+}
+# Syslog PRI severity (PRI % 8) -> app severity
+SYSLOG_SEVERITIES = ["FATAL", "FATAL", "FATAL", "ERROR", "WARN", "INFO", "INFO", "DEBUG"]
+
+JSON_KEYS = {
+    "TIMESTAMP": ["timestamp", "@timestamp", "time", "ts", "datetime", "date"],
+    "SEVERITY": ["severity", "level", "levelname", "log.level", "lvl"],
+    "SOURCE": ["source", "service", "service.name", "app", "application", "logger", "logger_name", "component"],
+    "HOST": ["host", "hostname", "host.name", "node"],
+    "MESSAGE": ["message", "msg", "log", "text", "event"],
+}
+
+RFC5424_RE = re.compile(
+    r"^<(?P<pri>\d{1,3})>1 (?P<ts>\S+) (?P<host>\S+) (?P<app>\S+) \S+ \S+ "
+    r"(?:-|(?:\[.*?\])+) ?(?P<msg>.*)$"
+)
+RFC3164_RE = re.compile(
+    r"^(?:<(?P<pri>\d{1,3})>)?(?P<ts>[A-Z][a-z]{2} [ \d]\d \d{2}:\d{2}:\d{2}) "
+    r"(?P<host>\S+) (?P<app>[^:\[\s]+)(?:\[\d+\])?: ?(?P<msg>.*)$"
+)
+APP_RE = re.compile(
+    r"^\[?(?P<ts>\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?)\]?"
+    r"\s+\[?(?P<level>[A-Za-z]+)\]?"
+    r"(?:\s+\[(?P<source>[^\]]+)\]|\s+(?P<source2>[\w.\-]+):)?"
+    r"\s+(?P<msg>.*)$"
+)
+
+
+# --- Parsing (runs in worker processes) ---
+def _normalize_severity(value, default="INFO"):
+    if value is None:
+        return default
+    return SEVERITY_ALIASES.get(str(value).strip().upper(), default)
+
+
+def _parse_timestamp(value, tz, year=None):
+    """Parse ISO-8601, epoch seconds/millis or RFC 3164 timestamps to naive time in ``tz``.
+
+    Timestamps without an offset are assumed to be in ``tz`` already.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        seconds = value / 1000 if value > 1e11 else value
+        return datetime.fromtimestamp(seconds, tz=tz).replace(tzinfo=None)
+    text = str(value).strip()
+    try:
+        # Epoch seconds/millis as text, fractional ones included
+        return _parse_timestamp(float(text), tz)
+    except ValueError:
+        pass
+    if text[:3].isalpha():
+        ts = datetime.strptime(text, "%b %d %H:%M:%S")
+        return ts.replace(year=year or datetime.now().year)
+    text = text.replace(",", ".").replace("Z", "+00:00")
+    ts = datetime.fromisoformat(text)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(tz).replace(tzinfo=None)
+    return ts
+
+
+def _json_get(record, keys):
+    """First scalar value among ``keys``; dotted keys walk nested objects (ECS style)."""
+    for key in keys:
+        node = record.get(key)
+        if node is not None and not isinstance(node, (dict, list)):
+            return node
+        node = record
+        for part in key.split("."):
+            if not isinstance(node, dict) or part not in node:
+                node = None
+                break
+            node = node[part]
+        if node is not None and not isinstance(node, (dict, list)):
+            return node
+    return None
+
+
+def _parse_jsonl(line, defaults, year, tz):
+    record = json.loads(line)
+    message = _json_get(record, JSON_KEYS["MESSAGE"])
+    return [
+        _parse_timestamp(_json_get(record, JSON_KEYS["TIMESTAMP"]), tz),
+        _normalize_severity(_json_get(record, JSON_KEYS["SEVERITY"])),
+        _json_get(record, JSON_KEYS["SOURCE"]) or defaults["SOURCE"],
+        _json_get(record, JSON_KEYS["HOST"]) or defaults["HOST"],
+        message if isinstance(message, str) else json.dumps(record, ensure_ascii=False),
+    ]
+
+
+def _parse_syslog(line, defaults, year, tz):
+    m = RFC5424_RE.match(line) or RFC3164_RE.match(line)
+    if m is None:
+        return None
+    pri = m.group("pri")
+    severity = SYSLOG_SEVERITIES[int(pri) % 8] if pri else "INFO"
+    return [
+        _parse_timestamp(m.group("ts"), tz, year),
+        severity,
+        m.group("app") if m.group("app") != "-" else defaults["SOURCE"],
+        m.group("host") if m.group("host") != "-" else defaults["HOST"],
+        m.group("msg"),
+    ]
+
+
+def _app_record(line):
+    """APP_RE match of a line that starts a record, or None for continuation lines."""
+    m = APP_RE.match(line)
+    if m is None or m.group("level").upper() not in SEVERITY_ALIASES:
+        return None
+    return m
+
+
+def _parse_app(line, defaults, year, tz):
+    m = _app_record(line)
+    if m is None:
+        return None
+    return [
+        _parse_timestamp(m.group("ts"), tz),
+        _normalize_severity(m.group("level")),
+        m.group("source") or m.group("source2") or defaults["SOURCE"],
+        defaults["HOST"],
+        m.group("msg"),
+    ]
+
+
+PARSERS = {"jsonl": _parse_jsonl, "syslog": _parse_syslog, "app": _parse_app}
+
+
+def detect_format(path):
+    with _open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                return "jsonl"
+            if RFC5424_RE.match(line) or RFC3164_RE.match(line):
+                return "syslog"
+            return "app"
+    return "app"
+
+
+def parse_chunk(lines, fmt, defaults, year, tz_name, out_path):
+    """Parse ``lines`` and write them to ``out_path`` as Parquet.
+
+    Returns (out_path, rows_written, rows_rejected).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parse = PARSERS[fmt]
+    tz = ZoneInfo(tz_name)
+    columns = [[] for _ in COLUMNS]
+    rejected = 0
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+        try:
+            row = parse(line, defaults, year, tz)
+        except (ValueError, TypeError, KeyError, OverflowError, OSError):
+            # OverflowError / OSError: epoch values outside the platform's datetime range
+            row = None
+        if row is None or row[0] is None:
+            if fmt == "app" and columns[4]:
+                # continuation line (stack trace etc.) of the previous record
+                columns[4][-1] += "\n" + line
+            else:
+                rejected += 1
+            continue
+        row[1] = row[1][:10]
+        row[2] = str(row[2])[:100]
+        row[3] = str(row[3])[:100]
+        for col, value in zip(columns, row):
+            col.append(value)
+
+    if not columns[0]:
+        return None, 0, rejected
+
+    table = pa.table({
+        "TIMESTAMP": pa.array(columns[0], type=pa.timestamp("us")),
+        "SEVERITY": pa.array(columns[1], type=pa.string()),
+        "SOURCE": pa.array(columns[2], type=pa.string()),
+        "HOST": pa.array(columns[3], type=pa.string()),
+        "MESSAGE": pa.array(columns[4], type=pa.string()),
+        # JSON text; parsed into the FIELDS VARIANT by the COPY transformation
+        "FIELDS": pa.array([json.dumps(extract_fields(m)) for m in columns[4]], type=pa.string()),
+    })
+    pq.write_table(table, out_path, compression="snappy")
+    return out_path, table.num_rows, rejected
+
+
+# --- Reading ---
+def _open(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def iter_chunks(path, chunk_lines, fmt):
+    """Yield (lines, chars) chunks; ``app`` chunks only start at a record line.
+
+    Continuation lines (stack traces, ``Caused by: ...``) therefore always stay
+    in the chunk of the record they belong to.
+    """
+    with _open(path) as f:
+        chunk = []
+        size = 0
+        for line in f:
+            if len(chunk) >= chunk_lines and (fmt != "app" or _app_record(line) is not None):
+                yield chunk, size
+                chunk = []
+                size = 0
+            chunk.append(line)
+            size += len(line)
+        if chunk:
+            yield chunk, size
+
+
+# --- Metrics ---
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.bytes_read = 0
+        self.rows = 0
+        self.rejected = 0
+        self.files_written = 0
+        self.files_uploaded = 0
+        self.bytes_uploaded = 0
+        self.reader_blocked = 0.0
+        self.upload_seconds = 0.0
+        self.copy_seconds = 0.0
+        self.max_inflight = 0
+        self.lock = threading.Lock()
+
+    def report(self, inflight, upload_backlog, final=False):
+        elapsed = max(time.time() - self.started, 1e-6)
+        line = (
+            f"{'done' if final else 'progress'}: {self.rows:,} rows "
+            f"({self.rows / elapsed:,.0f} rows/s, {self.bytes_read / elapsed / 1e6:,.1f} MB/s read), "
+            f"rejected {self.rejected:,}, parts {self.files_uploaded}/{self.files_written} uploaded, "
+            f"in-flight {inflight}, upload backlog {upload_backlog}, "
+            f"reader blocked {self.reader_blocked:,.1f}s"
+        )
+        if final:
+            line += (
+                f", upload {self.upload_seconds:,.1f}s ({self.bytes_uploaded / 1e6:,.1f} MB), "
+                f"copy {self.copy_seconds:,.1f}s, peak in-flight {self.max_inflight}, "
+                f"total {elapsed:,.1f}s"
+            )
+        print(line, file=sys.stderr)
+
+
+# --- Uploading ---
+class Uploader(threading.Thread):
+    """Uploads finished Parquet parts in groups while parsing continues."""
+
+    def __init__(self, session, stage, metrics, batch_files, parallel, max_backlog):
+        super().__init__(daemon=True)
+        self.session = session
+        self.stage = stage
+        self.metrics = metrics
+        self.batch_files = batch_files
+        self.parallel = parallel
+        self.queue = queue.Queue(maxsize=max_backlog)
+        self.error = None
+
+    def run(self):
+        pending = []
+        while True:
+            path = self.queue.get()
+            if path is not None:
+                pending.append(path)
+            if pending and (path is None or len(pending) >= self.batch_files):
+                if self.error is None:
+                    try:
+                        self._upload(pending)
+                    except Exception as e:
+                        # Surfaced to the main thread; keep draining so it never blocks on put().
+                        self.error = e
+                pending = []
+            if path is None:
+                return
+
+    def _upload(self, paths):
+        batch_dir = os.path.join(os.path.dirname(paths[0]), f"upload-{uuid.uuid4().hex[:8]}")
+        os.makedirs(batch_dir)
+        size = 0
+        for path in paths:
+            size += os.path.getsize(path)
+            shutil.move(path, batch_dir)
+        started = time.time()
+        self.session.file.put(
+            os.path.join(batch_dir, "*.parquet"), self.stage,
+            auto_compress=False, overwrite=True, parallel=self.parallel,
+        )
+        shutil.rmtree(batch_dir)
+        with self.metrics.lock:
+            self.metrics.upload_seconds += time.time() - started
+            self.metrics.files_uploaded += len(paths)
+            self.metrics.bytes_uploaded += size
+
+
+# --- Pipeline ---
+def session_timezone(session):
+    """The session's TIMEZONE parameter, the zone CURRENT_TIMESTAMP() reports in."""
+    row = session.sql("SHOW PARAMETERS LIKE 'TIMEZONE' IN SESSION").collect()[0]
+    return str(show_value(row, "value"))
+
+
+def _distribute(session, source, partitions):
+    """Move the rows of ``source`` to the partition of their month, or to LOGS."""
+    columns = "LOG_ID, TIMESTAMP, SEVERITY, SOURCE, HOST, MESSAGE, FIELDS"
+    branches, params = [], []
+    for p in partitions:
+        branches.append(f"WHEN TIMESTAMP >= ? AND TIMESTAMP < ? THEN INTO {p.table} ({columns})")
+        params.extend([p.start, p.end])
+    # LOG_IDs come from the sequence shared by every partition, LOGS included.
+    session.sql(
+        f"""
+        INSERT FIRST
+            {" ".join(branches)}
+            ELSE INTO {TABLE_FQN} ({columns})
+        SELECT {log_partitions.LOG_ID_SEQUENCE}.NEXTVAL AS LOG_ID,
+               TIMESTAMP, SEVERITY, SOURCE, HOST, MESSAGE, FIELDS
+        FROM {source}
+        """,
+        params=params,
+    ).collect()
+
+
+def ingest(session, paths, fmt="auto", table=None, workers=None, chunk_lines=200000,
+           upload_batch_files=8, upload_parallel=16, default_host=None, default_source=None,
+           year=None, timezone=None, report_interval=5.0):
+    """Parse ``paths`` and bulk-load them into ``table``. Returns the Metrics.
+
+    Without ``table`` rows are routed by TIMESTAMP to LOGS and its partitions.
+    Timestamps are stored in ``timezone`` (default: the session's TIMEZONE).
+    """
+    timezone = timezone or session_timezone(session)
+    ZoneInfo(timezone)  # fail before parsing on an unknown zone
+    workers = workers or os.cpu_count() or 4
+    max_inflight = workers * 2
+    metrics = Metrics()
+    work_dir = tempfile.mkdtemp(prefix="log-ingest-")
+    suffix = uuid.uuid4().hex[:8].upper()
+    schema = f"{DB}.{SCHEMA}"
+    stage = f"@{schema}.LOG_INGEST_{suffix}"
+    session.sql(f"CREATE TEMPORARY STAGE {stage[1:]}").collect()
+
+    uploader = Uploader(
+        session, stage, metrics, upload_batch_files, upload_parallel, max_backlog=max_inflight,
+    )
+    uploader.start()
+    inflight = set()
+    last_report = time.time()
+
+    def drain(block):
+        nonlocal last_report
+        if not inflight:
+            return
+        done, _ = wait(inflight, return_when=FIRST_COMPLETED) if block else (
+            {f for f in inflight if f.done()}, None
+        )
+        for future in done:
+            inflight.discard(future)
+            out_path, rows, rejected = future.result()
+            metrics.rows += rows
+            metrics.rejected += rejected
+            if out_path is not None:
+                metrics.files_written += 1
+                uploader.queue.put(out_path)  # blocks when uploads fall behind
+        if uploader.error is not None:
+            raise uploader.error
+        if time.time() - last_report >= report_interval:
+            metrics.report(len(inflight), uploader.queue.qsize())
+            last_report = time.time()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            part = 0
+            for path in paths:
+                file_fmt = detect_format(path) if fmt == "auto" else fmt
+                defaults = {
+                    "HOST": default_host or "unknown",
+                    "SOURCE": default_source or os.path.basename(path).split(".")[0],
+                }
+                for lines, size in iter_chunks(path, chunk_lines, file_fmt):
+                    # Backpressure: never hold more than max_inflight chunks in memory.
+                    if len(inflight) >= max_inflight:
+                        blocked = time.time()
+                        drain(block=True)
+                        metrics.reader_blocked += time.time() - blocked
+                    out_path = os.path.join(work_dir, f"part-{part:06d}.parquet")
+                    part += 1
+                    inflight.add(pool.submit(
+                        parse_chunk, lines, file_fmt, defaults, year, timezone, out_path,
+                    ))
+                    metrics.max_inflight = max(metrics.max_inflight, len(inflight))
+                    metrics.bytes_read += size
+                    drain(block=False)
+            while inflight:
+                drain(block=True)
+
+        uploader.queue.put(None)
+        uploader.join()
+        if uploader.error is not None:
+            raise uploader.error
+
+        started = time.time()
+        partitions = [] if table else log_partitions.list_partitions(session, refresh=True)
+        copy_table = table or TABLE_FQN
+        if partitions:
+            copy_table = f"{schema}.LOG_INGEST_{suffix}"
+            session.sql(
+                f"CREATE TEMPORARY TABLE {copy_table} (TIMESTAMP TIMESTAMP_NTZ, SEVERITY VARCHAR, "
+                f"SOURCE VARCHAR, HOST VARCHAR, MESSAGE VARCHAR, FIELDS VARIANT)"
+            ).collect()
+        session.sql(
+            f"""
+            COPY INTO {copy_table} (TIMESTAMP, SEVERITY, SOURCE, HOST, MESSAGE, FIELDS)
+            FROM (
+                SELECT $1:TIMESTAMP::TIMESTAMP_NTZ, $1:SEVERITY::VARCHAR, $1:SOURCE::VARCHAR,
+                       $1:HOST::VARCHAR, $1:MESSAGE::VARCHAR, PARSE_JSON($1:FIELDS::VARCHAR)
+                FROM {stage}
+            )
+            FILE_FORMAT = (TYPE = PARQUET USE_LOGICAL_TYPE = TRUE)
+            PURGE = TRUE
+            """
+        ).collect()
+        if partitions:
+            _distribute(session, copy_table, partitions)
+        metrics.copy_seconds = time.time() - started
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    metrics.report(0, 0, final=True)
+    return metrics
+
+
+def main():
+    import argparse
+    from snowflake.snowpark import Session
+
+    parser = argparse.ArgumentParser(description="Bulk-load log files into the LOGS table.")
+    parser.add_argument("paths", nargs="+", help="log files or glob patterns (.gz supported)")
+    parser.add_argument("--connection", default="default", help="connection name in connections.toml")
+    parser.add_argument("--format", choices=FORMATS, default="auto")
+    parser.add_argument("--table", default=None,
+                        help="load everything into this table (default: LOGS / monthly partitions by TIMESTAMP)")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument("--chunk-lines", type=int, default=200000)
+    parser.add_argument("--upload-batch-files", type=int, default=8)
+    parser.add_argument("--upload-parallel", type=int, default=16)
+    parser.add_argument("--host", default=None, help="HOST for formats that do not carry one")
+    parser.add_argument("--source", default=None, help="SOURCE for formats that do not carry one")
+    parser.add_argument("--year", type=int, default=None, help="year for RFC 3164 syslog timestamps")
+    parser.add_argument("--timezone", default=None,
+                        help="IANA zone to store timestamps in (default: the session's TIMEZONE)")
+    args = parser.parse_args()
+
+    paths = []
+    for pattern in args.paths:
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+
+    session = Session.builder.config("connection_name", args.connection).create()
+    ingest(
+        session, paths, fmt=args.format, table=args.table, workers=args.workers,
+        chunk_lines=args.chunk_lines, upload_batch_files=args.upload_batch_files,
+        upload_parallel=args.upload_parallel, default_host=args.host,
+        default_source=args.source, year=args.year, timezone=args.timezone,
+    )
+
+
+if __name__ == "__main__":
+    main()
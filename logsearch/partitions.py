@@ -0,0 +1,148 @@
+"""Monthly time-partitioned log tables and range-aware query routing.
+
+Partitions are plain tables named ``LOGS_YYYY_MM`` in the app schema, each
+holding the rows whose TIMESTAMP falls in that calendar month. When at least
+one partition exists, searches only touch the partitions overlapping the
+selected time range, plus ``LOGS`` for any part of the range no partition
+covers. Creating a partition moves its month out of ``LOGS``, so each row
+lives in exactly one table. Cold partitions can run without Search
+Optimization to save cost.
+"""
+
+import re
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from logsearch.query import DB, SCHEMA, TABLE_FQN, show_value
+
+PARTITION_RE = re.compile(r"^LOGS_(\d{4})_(\d{2})$")
+# Shared by every partition so LOG_ID stays unique across the table set.
+LOG_ID_SEQUENCE = f"{DB}.{SCHEMA}.LOG_ID_SEQ"
+CACHE_TTL_SECONDS = 300
+
+Partition = namedtuple("Partition", ["table", "start", "end", "rows", "search_optimization"])
+
+_cache = {"at": 0.0, "partitions": None}
+
+
+def _month_start(year, month):
+    return datetime(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+
+def partition_name(year, month):
+    return f"{DB}.{SCHEMA}.LOGS_{year:04d}_{month:02d}"
+
+
+def list_partitions(session, refresh=False):
+    """Return partitions sorted by start time (cached for CACHE_TTL_SECONDS)."""
+    if not refresh and _cache["partitions"] is not None and time.time() - _cache["at"] < CACHE_TTL_SECONDS:
+        return _cache["partitions"]
+
+    rows = session.sql(f"SHOW TABLES LIKE 'LOGS_%' IN SCHEMA {DB}.{SCHEMA}").collect()
+    partitions = []
+    for row in rows:
+        m = PARTITION_RE.match(str(show_value(row, "name")))
+        if m is None:
+            continue
+        year, month = int(m.group(1)), int(m.group(2))
+        partitions.append(Partition(
+            table=partition_name(year, month),
+            start=_month_start(year, month),
+            end=_month_start(year, month + 1),
+            rows=int(show_value(row, "rows") or 0),
+            search_optimization=str(show_value(row, "search_optimization")).upper() == "ON",
+        ))
+    partitions.sort(key=lambda p: p.start)
+
+    _cache["at"] = time.time()
+    _cache["partitions"] = partitions
+    return partitions
+
+
+def route(partitions, start, end):
+    """Tables to scan for [start, end], newest first.
+
+    LOGS is added whenever part of the range is not covered by a partition,
+    since rows of months without a partition table stay there.
+    """
+    tables = [p.table for p in reversed(partitions) if p.start <= end and p.end > start]
+    covered = start
+    for p in partitions:
+        if p.end <= covered:
+            continue
+        if p.start > covered:
+            break
+        covered = p.end
+    if covered <= end:
+        tables.append(TABLE_FQN)
+    return tables
+
+
+def all_tables(partitions):
+    """Every partition, newest first, followed by LOGS."""
+    return [p.table for p in reversed(partitions)] + [TABLE_FQN]
+
+
+# --- Maintenance ---
+def create_partition(session, year, month, search_optimization=True):
+    """Create ``LOGS_YYYY_MM`` and move that month's rows into it from LOGS."""
+    table = partition_name(year, month)
+    # LOG_IDs already handed out by LOGS or any partition are never reused.
+    max_ids = " UNION ALL ".join(
+        f"SELECT MAX(LOG_ID) AS MAX_ID FROM {t}"
+        for t in all_tables(list_partitions(session, refresh=True))
+    )
+    next_id = session.sql(
+        f"SELECT COALESCE(MAX(MAX_ID), 0) + 1 AS NEXT_ID FROM ({max_ids})"
+    ).collect()[0]["NEXT_ID"]
+    session.sql(f"CREATE SEQUENCE IF NOT EXISTS {LOG_ID_SEQUENCE} START = {int(next_id)}").collect()
+    session.sql(
+        f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            LOG_ID      NUMBER DEFAULT {LOG_ID_SEQUENCE}.NEXTVAL,
+            TIMESTAMP   TIMESTAMP_NTZ,
+            SEVERITY    VARCHAR(10),
+            SOURCE      VARCHAR(100),
+            HOST        VARCHAR(100),
+            MESSAGE     VARCHAR(16777216),
+            FIELDS      VARIANT
+        )
+        """
+    ).collect()
+    month_range = [_month_start(year, month), _month_start(year, month + 1)]
+    # Moved in one transaction so searches never see the month twice or not at all.
+    session.sql("BEGIN").collect()
+    try:
+        session.sql(
+            f"""
+            INSERT INTO {table} (LOG_ID, TIMESTAMP, SEVERITY, SOURCE, HOST, MESSAGE, FIELDS)
+            SELECT LOG_ID, TIMESTAMP, SEVERITY, SOURCE, HOST, MESSAGE, FIELDS
+            FROM {TABLE_FQN}
+            WHERE TIMESTAMP >= ? AND TIMESTAMP < ?
+            ORDER BY TIMESTAMP
+            """,
+            params=month_range,
+        ).collect()
+        session.sql(
+            f"DELETE FROM {TABLE_FQN} WHERE TIMESTAMP >= ? AND TIMESTAMP < ?", params=month_range,
+        ).collect()
+        session.sql("COMMIT").collect()
+    except Exception:
+        session.sql("ROLLBACK").collect()
+        raise
+    if search_optimization:
+        set_search_optimization(session, table, True)
+    _cache["partitions"] = None
+    return table
+
+
+def set_search_optimization(session, table, enabled):
+    if enabled:
+        session.sql(
+            f"ALTER TABLE {table} ADD SEARCH OPTIMIZATION "
+            f"ON FULL_TEXT(MESSAGE, ANALYZER => 'UNICODE_ANALYZER')"
+        ).collect()
+    else:
+        session.sql(f"ALTER TABLE {table} DROP SEARCH OPTIMIZATION").collect()
+    _cache["partitions"] = None
@@ -0,0 +1,171 @@
+"""SQL builders shared by the Streamlit pages and the background jobs.
+
+Everything that turns the sidebar filters into a WHERE clause lives here so the
+Keyword Search page, the alert scheduler and the other helpers generate exactly
+the same predicates (and therefore hit the same Search Optimization paths).
+The catalog helpers at the end (SHOW rows, per-table streams) are shared by
+the background jobs the same way.
+"""
+
+import re
+
+DB = "LOG_SEARCH_APP"
+SCHEMA = "PUBLIC"
+TABLE_FQN = f"{DB}.{SCHEMA}.LOGS"
+
+SEVERITIES = ["FATAL", "ERROR", "WARN", "INFO", "DEBUG"]
+SEARCH_MODES = ["OR", "AND", "PHRASE"]
+RESULT_COLUMNS = ["LOG_ID", "TIMESTAMP", "SEVERITY", "SOURCE", "HOST", "MESSAGE"]
+# Columns SEARCH() looks at. Listed explicitly rather than (*) so the derived
+# FIELDS VARIANT column is not searched a second time.
+SEARCH_COLUMNS = ["SEVERITY", "SOURCE", "HOST", "MESSAGE"]
+FIELD_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# List views fetch only this many leading MESSAGE characters plus the original
+# length; full messages are loaded by LOG_ID on demand.
+PREVIEW_CHARS = 200
+PREVIEW_COLUMNS = RESULT_COLUMNS + ["MESSAGE_LENGTH"]
+
+# Characters of MESSAGE used to build its template
+TEMPLATE_CHARS = 200
+# Variable parts of a message collapsed so repeated messages share a template
+TEMPLATE_SQL = (
+    f"REGEXP_REPLACE(REGEXP_REPLACE(REGEXP_REPLACE(LEFT(MESSAGE, {TEMPLATE_CHARS}), "
+    r"'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}', '<uuid>'), "
+    r"'0x[0-9a-fA-F]+', '<hex>'), "
+    r"'[0-9]+', '<n>')"
+)
+
+# Leading comment on the searches the app runs, so query history can be
+# filtered back to them (see logsearch.advisor).
+QUERY_TAG = "log_search_app"
+
+
+def tag_query(query, kind, **labels):
+    """Prefix ``query`` with ``/* log_search_app kind=... key=value */``."""
+    text = " ".join([f"kind={kind}"] + [f"{key}={value}" for key, value in labels.items()])
+    return f"/* {QUERY_TAG} {text} */ {query.strip()}"
+
+
+def build_predicates(search_text, severities, sources, mode, all_sources=None, fields=None):
+    """Return (conditions, params) for every filter except the time range.
+
+    ``severities`` / ``sources`` are skipped when empty or when they cover every
+    known value, so "all selected" never adds a useless IN list to the scan.
+    ``fields`` is a ``{field: value}`` dict matched against the FIELDS column.
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+
+    conditions = []
+    params = []
+
+    # Severity
+    if severities and len(severities) < len(SEVERITIES):
+        placeholders = ", ".join(["?"] * len(severities))
+        conditions.append(f"SEVERITY IN ({placeholders})")
+        params.extend(severities)
+
+    # Source
+    if sources and (all_sources is None or len(sources) < len(all_sources)):
+        placeholders = ", ".join(["?"] * len(sources))
+        conditions.append(f"SOURCE IN ({placeholders})")
+        params.extend(sources)
+
+    # Extracted fields (see logsearch.fields)
+    for name, value in (fields or {}).items():
+        if not FIELD_NAME_RE.match(name):
+            raise ValueError(f"Invalid field name: {name}")
+        conditions.append(f'FIELDS:"{name}"::VARCHAR = ?')
+        params.append(str(value))
+
+    # Full-text search
+    if search_text and search_text.strip():
+        conditions.append(
+            f"SEARCH(({', '.join(SEARCH_COLUMNS)}), ?, "
+            f"SEARCH_MODE => '{mode}', ANALYZER => 'UNICODE_ANALYZER')"
+        )
+        params.append(search_text.strip())
+
+    return conditions, params
+
+
+def build_where(search_text, severities, sources, start, end, mode, all_sources=None, fields=None):
+    """Return (where_clause, params) including the ``TIMESTAMP BETWEEN`` range."""
+    conditions = ["TIMESTAMP BETWEEN ? AND ?"]
+    params = [start, end]
+
+    extra_conditions, extra_params = build_predicates(
+        search_text, severities, sources, mode, all_sources, fields
+    )
+    conditions.extend(extra_conditions)
+    params.extend(extra_params)
+
+    return " AND ".join(conditions), params
+
+
+def union_select(tables, select, where_clause, params, order_by=None, limit=None):
+    """UNION ALL the same SELECT over ``tables``, pushing ORDER BY/LIMIT into each branch.
+
+    Returns (query, params) with ``params`` repeated once per branch.
+    """
+    tail = ""
+    if order_by:
+        tail += f" ORDER BY {order_by}"
+    if limit is not None:
+        tail += f" LIMIT {int(limit)}"
+
+    if len(tables) == 1:
+        return f"SELECT {select} FROM {tables[0]} WHERE {where_clause}{tail}", list(params)
+    branches = [
+        f"SELECT * FROM (SELECT {select} FROM {table} WHERE {where_clause}{tail})"
+        for table in tables
+    ]
+    query = "SELECT * FROM (\n" + "\nUNION ALL\n".join(branches) + f"\n){tail}"
+    return query, list(params) * len(tables)
+
+
+def select_list(preview_chars=None):
+    """RESULT_COLUMNS, with MESSAGE cut to ``preview_chars`` plus MESSAGE_LENGTH if given."""
+    if preview_chars is None:
+        return ", ".join(RESULT_COLUMNS)
+    return (
+        f"LOG_ID, TIMESTAMP, SEVERITY, SOURCE, HOST, "
+        f"LEFT(MESSAGE, {int(preview_chars)}) AS MESSAGE, LENGTH(MESSAGE) AS MESSAGE_LENGTH"
+    )
+
+
+def build_query(search_text, severities, sources, start, end, mode, limit, all_sources=None, tables=None,
+                preview_chars=None, fields=None):
+    """Return (query, params) for a result search.
+
+    ``tables`` comes from ``partitions.route``; by default the single LOGS table
+    is searched. With ``preview_chars`` only a MESSAGE prefix is selected.
+    """
+    where_clause, params = build_where(
+        search_text, severities, sources, start, end, mode, all_sources, fields
+    )
+    return union_select(
+        tables or [TABLE_FQN], select_list(preview_chars), where_clause, params,
+        order_by="TIMESTAMP DESC", limit=limit,
+    )
+
+
+# --- Catalog helpers ---
+def show_value(row, name):
+    """Column ``name`` of a SHOW output row (a Row or its ``as_dict()``)."""
+    if hasattr(row, "as_dict"):
+        row = row.as_dict()
+    # SHOW output keys may come back quoted depending on the client (see README 5.2)
+    return row[name] if name in row else row.get(f'"{name}"')
+
+
+def stream_name(table, kind):
+    """Append-only stream of ``table`` used by the ``kind`` job (``FIELDS``, ``CORPUS``)."""
+    return f"{table}_{kind}_STREAM"
+
+
+def list_streams(session, kind):
+    """Fully qualified names of the existing ``kind`` streams in the app schema."""
+    rows = session.sql(f"SHOW STREAMS LIKE '%_{kind}_STREAM' IN SCHEMA {DB}.{SCHEMA}").collect()
+    return {f"{DB}.{SCHEMA}.{show_value(row, 'name')}" for row in rows}
@@ -0,0 +1,195 @@
+"""Arrow-native result path from Snowflake to the charts and tables.
+
+Results are fetched as Arrow record batches straight from the connector,
+low-cardinality columns are dictionary-encoded, and the summary metrics and
+charts are aggregated with ``pyarrow.compute`` on those buffers. Only the small
+aggregates are turned into pandas for ``st.bar_chart``; the result table itself
+is handed to ``st.dataframe`` as Arrow.
+"""
+
+import json
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from logsearch import partitions
+from logsearch.query import RESULT_COLUMNS, SEVERITIES, union_select
+
+DICTIONARY_COLUMNS = ["SEVERITY", "SOURCE", "HOST"]
+# LOG_IDs per full-message lookup (bound as one JSON array parameter)
+MESSAGE_BATCH = 5000
+
+
+def fetch_arrow(session, query, params=None, columns=RESULT_COLUMNS):
+    """Run ``query`` and return a ``pyarrow.Table`` without going through pandas."""
+    cursor = session.connection.cursor()
+    try:
+        cursor.execute(query, params)
+        # Each connector batch is dropped as soon as its normalized form exists
+        batches = [normalize(batch) for batch in cursor.fetch_arrow_batches()]
+    finally:
+        cursor.close()
+    if not batches:
+        return pa.table({name: pa.array([], type=pa.string()) for name in columns})
+    table = pa.concat_tables(batches)
+    del batches
+    return encode(table)
+
+
+def normalize(table):
+    """Cast a connector batch to one fixed schema.
+
+    Batches of the same result may use different integer widths / timestamp
+    units (and plain or dictionary strings); after this they concatenate.
+    """
+    fields = []
+    for field in table.schema:
+        t = field.type
+        if pa.types.is_integer(t):
+            t = pa.int64()
+        elif pa.types.is_timestamp(t):
+            t = pa.timestamp("us")
+        elif pa.types.is_dictionary(t) or pa.types.is_large_string(t):
+            t = pa.string()
+        fields.append(pa.field(field.name, t))
+    return table.cast(pa.schema(fields))
+
+
+def encode(table):
+    """Dictionary-encode the low-cardinality string columns in place of plain strings."""
+    for name in DICTIONARY_COLUMNS:
+        if name in table.column_names and not pa.types.is_dictionary(table.schema.field(name).type):
+            i = table.column_names.index(name)
+            table = table.set_column(i, name, pc.dictionary_encode(table.column(name)))
+    return table.unify_dictionaries()
+
+
+def from_records(records, columns):
+    """Build an Arrow table from a list of dicts in one columnar step."""
+    return encode(pa.Table.from_pylist([dict(r) for r in records]).select(columns))
+
+
+def _arrow_types(arrow_type):
+    # Plain strings stay Arrow-backed; dictionaries become Categorical (codes + categories).
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.ArrowDtype(arrow_type)
+    return None
+
+
+def to_frame(table):
+    """pandas view of ``table`` for row-wise rendering, without object-dtype strings."""
+    return table.to_pandas(types_mapper=_arrow_types, self_destruct=False)
+
+
+# --- Aggregations ---
+# Every aggregation accepts a pyarrow.Table or a governor.SpilledResult; the
+# latter is aggregated one stored batch at a time.
+def _parts(table, columns):
+    if isinstance(table, pa.Table):
+        yield table.select(columns)
+    else:
+        yield from table.to_batches(columns)
+
+
+def value_counts(table, column, label=None):
+    """DataFrame [label, Count] sorted by Count descending."""
+    if table.num_rows == 0:
+        return pd.DataFrame({label or column: [], "Count": []})
+    frames = []
+    for part in _parts(table, [column]):
+        counts = pc.value_counts(part.column(column))
+        values = counts.field("values")
+        if pa.types.is_dictionary(values.type):
+            values = values.dictionary_decode()
+        frames.append(pd.DataFrame({
+            label or column: values.to_pylist(), "Count": counts.field("counts").to_pylist(),
+        }))
+    df = frames[0] if len(frames) == 1 else pd.concat(frames).groupby(label or column, as_index=False)["Count"].sum()
+    return df.sort_values("Count", ascending=False).reset_index(drop=True)
+
+
+def severity_counts(table):
+    counts = value_counts(table, "SEVERITY").set_index("SEVERITY")["Count"]
+    return {sev: int(counts.get(sev, 0)) for sev in SEVERITIES}
+
+
+def timeline(table, unit="hour"):
+    """Severity x time-bucket pivot for ``st.bar_chart`` (index = bucket start)."""
+    frames = []
+    for part in _parts(table, ["TIMESTAMP", "SEVERITY"]):
+        buckets = pc.floor_temporal(part.column("TIMESTAMP"), unit=unit)
+        frames.append(
+            pa.table({"Time": buckets, "SEVERITY": part.column("SEVERITY")})
+            .group_by(["Time", "SEVERITY"])
+            .aggregate([("SEVERITY", "count")])
+            .to_pandas()
+        )
+    grouped = pd.concat(frames)
+    grouped["SEVERITY"] = grouped["SEVERITY"].astype(str)
+    pivot = grouped.pivot_table(
+        index="Time", columns="SEVERITY", values="SEVERITY_count", aggfunc="sum", fill_value=0
+    )
+    sev_order = [s for s in SEVERITIES if s in pivot.columns]
+    return pivot[sev_order]
+
+
+# --- Full messages on demand ---
+def fetch_messages(session, log_ids, timestamps, log_partitions=None, batch_size=MESSAGE_BATCH):
+    """Return {LOG_ID: MESSAGE} for the given rows, fetched in batches.
+
+    Rows are grouped in TIMESTAMP order so each batch carries a tight
+    ``TIMESTAMP BETWEEN`` range that prunes micro-partitions and routes to as
+    few partition tables as possible.
+    """
+    rows = sorted(zip(timestamps, log_ids))
+    messages = {}
+    for i in range(0, len(rows), batch_size):
+        batch = rows[i:i + batch_size]
+        start, end = batch[0][0], batch[-1][0]
+        where_clause = (
+            "LOG_ID IN (SELECT VALUE::NUMBER FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?)))) "
+            "AND TIMESTAMP BETWEEN ? AND ?"
+        )
+        query, params = union_select(
+            partitions.route(log_partitions or [], start, end), "LOG_ID, MESSAGE", where_clause,
+            [json.dumps([int(log_id) for _, log_id in batch]), start, end],
+        )
+        table = fetch_arrow(session, query, params, columns=["LOG_ID", "MESSAGE"])
+        messages.update(zip(table.column("LOG_ID").to_pylist(), table.column("MESSAGE").to_pylist()))
+    return messages
+
+
+def with_full_messages(session, table, log_partitions=None, cache=None):
+    """Copy of ``table`` whose MESSAGE column holds full messages (for export)."""
+    cache = cache if cache is not None else {}
+    lengths = table.column("MESSAGE_LENGTH").to_pylist()
+    previews = table.column("MESSAGE").to_pylist()
+    log_ids = table.column("LOG_ID").to_pylist()
+    timestamps = table.column("TIMESTAMP").to_pylist()
+    missing = [
+        (log_id, ts) for log_id, ts, preview, length in zip(log_ids, timestamps, previews, lengths)
+        if length is not None and length > len(preview or "") and log_id not in cache
+    ]
+    if missing:
+        cache.update(fetch_messages(
+            session, [m[0] for m in missing], [m[1] for m in missing], log_partitions,
+        ))
+    full = [cache.get(log_id, preview) for log_id, preview in zip(log_ids, previews)]
+    i = table.column_names.index("MESSAGE")
+    return table.set_column(i, "MESSAGE", pa.array(full, type=pa.string())).drop(["MESSAGE_LENGTH"])
+
+
+def in_bucket(table, start, end, severity=None):
+    """Rows of ``table`` with start <= TIMESTAMP < end (and the given SEVERITY)."""
+    matches = []
+    for part in _parts(table, table.column_names):
+        ts = part.column("TIMESTAMP")
+        mask = pc.and_(
+            pc.greater_equal(ts, pa.scalar(start, type=ts.type)),
+            pc.less(ts, pa.scalar(end, type=ts.type)),
+        )
+        if severity is not None:
+            mask = pc.and_(mask, pc.equal(pc.cast(part.column("SEVERITY"), pa.string()), severity))
+        matches.append(part.filter(mask))
+    return pa.concat_tables(matches)
@@ -0,0 +1,153 @@
+"""Cost-aware warehouse selection for searches, based on EXPLAIN estimates.
+
+Every search is EXPLAINed before it runs. Small searches stay on the X-Small
+``SEARCH_WH``; heavy ones go to a separately configured larger warehouse, or,
+if that does not exist, temporarily upsize ``SEARCH_WH``. The size it had
+before is kept in the warehouse COMMENT, so concurrent heavy searches share
+one upsize and the last search to finish on an idle warehouse puts that size
+back (a size applied by hand from the sidebar included). Searches above the
+runaway budget can be narrowed to a time range that fits the budget.
+"""
+
+import json
+from collections import namedtuple
+from contextlib import contextmanager
+
+from logsearch.query import show_value
+
+WAREHOUSE = "SEARCH_WH"
+SMALL_SIZE = "XSMALL"
+HEAVY_WAREHOUSE = "SEARCH_WH_HEAVY"
+HEAVY_SIZE = "LARGE"
+# Smallest to largest, as SHOW WAREHOUSES sizes upper-cased without dashes
+SIZES = ["XSMALL", "SMALL", "MEDIUM", "LARGE", "XLARGE", "2XLARGE", "3XLARGE", "4XLARGE", "5XLARGE", "6XLARGE"]
+# COMMENT on a temporarily upsized warehouse, followed by the size to restore
+RESTORE_MARKER = "log_search_app restore_size="
+
+HEAVY_BYTES = 20 * 1024 ** 3      # route to the heavy warehouse above this
+RUNAWAY_BYTES = 200 * 1024 ** 3   # warn / auto-narrow above this
+
+Estimate = namedtuple("Estimate", ["partitions_total", "partitions_assigned", "bytes_assigned"])
+Plan = namedtuple("Plan", ["route", "warehouse", "size", "reason"])
+
+_heavy_exists = {}
+
+
+def explain(session, query, params):
+    """Compile-time scan estimate for ``query`` from ``EXPLAIN USING JSON``."""
+    row = session.sql(f"EXPLAIN USING JSON {query}", params=params).collect()[0]
+    content = row[0]
+    stats = json.loads(content).get("GlobalStats", {})
+    return Estimate(
+        partitions_total=int(stats.get("partitionsTotal", 0)),
+        partitions_assigned=int(stats.get("partitionsAssigned", 0)),
+        bytes_assigned=int(stats.get("bytesAssigned", 0)),
+    )
+
+
+def format_bytes(n):
+    for unit in ["B", "KB", "MB", "GB", "TB"]:
+        if n < 1024 or unit == "TB":
+            return f"{n:,.1f} {unit}"
+        n /= 1024
+
+
+def is_runaway(estimate, max_bytes=RUNAWAY_BYTES):
+    return estimate.bytes_assigned > max_bytes
+
+
+def narrow_start(start, end, estimate, max_bytes=RUNAWAY_BYTES):
+    """Later start time whose range should fit ``max_bytes``.
+
+    Assumes bytes scale with the time span, keeping the most recent part of the
+    range with 10% headroom.
+    """
+    if estimate.bytes_assigned <= 0:
+        return start
+    ratio = min(1.0, max_bytes / estimate.bytes_assigned * 0.9)
+    return end - (end - start) * ratio
+
+
+def _heavy_warehouse_exists(session):
+    if HEAVY_WAREHOUSE not in _heavy_exists:
+        try:
+            rows = session.sql(f"SHOW WAREHOUSES LIKE '{HEAVY_WAREHOUSE}'").collect()
+            _heavy_exists[HEAVY_WAREHOUSE] = len(rows) > 0
+        except Exception:
+            _heavy_exists[HEAVY_WAREHOUSE] = False
+    return _heavy_exists[HEAVY_WAREHOUSE]
+
+
+def plan_execution(session, estimate, heavy_bytes=HEAVY_BYTES):
+    """Decide where a search runs: default, heavy warehouse or temporary upsize."""
+    scan = format_bytes(estimate.bytes_assigned)
+    if estimate.bytes_assigned <= heavy_bytes:
+        return Plan("default", WAREHOUSE, SMALL_SIZE, f"{scan} to scan")
+    if _heavy_warehouse_exists(session):
+        return Plan("heavy", HEAVY_WAREHOUSE, None, f"{scan} to scan > {format_bytes(heavy_bytes)}")
+    return Plan("upsize", WAREHOUSE, HEAVY_SIZE, f"{scan} to scan > {format_bytes(heavy_bytes)}")
+
+
+def _size_rank(size):
+    key = str(size).upper().replace("-", "")
+    return SIZES.index(key) if key in SIZES else -1
+
+
+def _warehouse_state(session, warehouse):
+    """(size, comment, running statements) of ``warehouse`` from SHOW WAREHOUSES."""
+    row = session.sql(f"SHOW WAREHOUSES LIKE '{warehouse}'").collect()[0]
+    return (
+        str(show_value(row, "size")),
+        str(show_value(row, "comment") or ""),
+        int(show_value(row, "running") or 0),
+    )
+
+
+def _upsize(session, warehouse, size):
+    current, comment, _ = _warehouse_state(session, warehouse)
+    if comment.startswith(RESTORE_MARKER) or _size_rank(current) >= _size_rank(size):
+        return   # already upsized by another search, or set at least this large by hand
+    session.sql(
+        f"ALTER WAREHOUSE {warehouse} SET WAREHOUSE_SIZE = '{size}' "
+        f"COMMENT = '{RESTORE_MARKER}{current}' WAIT_FOR_COMPLETION = TRUE"
+    ).collect()
+
+
+def restore_size(session, warehouse=WAREHOUSE):
+    """Undo a temporary upsize once no statement is running on ``warehouse``."""
+    _, comment, running = _warehouse_state(session, warehouse)
+    if not comment.startswith(RESTORE_MARKER) or running > 0:
+        return False
+    session.sql(
+        f"ALTER WAREHOUSE {warehouse} SET WAREHOUSE_SIZE = '{comment[len(RESTORE_MARKER):]}'"
+    ).collect()
+    session.sql(f"ALTER WAREHOUSE {warehouse} UNSET COMMENT").collect()
+    return True
+
+
+@contextmanager
+def run_on(session, plan):
+    """Run the enclosed queries according to ``plan`` and undo any change afterwards."""
+    if plan.route == "heavy":
+        previous = session.get_current_warehouse()
+        session.use_warehouse(plan.warehouse)
+        try:
+            yield
+        finally:
+            session.use_warehouse(previous or WAREHOUSE)
+    elif plan.route == "upsize":
+        _upsize(session, plan.warehouse, plan.size)
+        try:
+            yield
+        finally:
+            restore_size(session, plan.warehouse)
+    else:
+        try:
+            yield
+        finally:
+            # An upsize left in place because this search was still running;
+            # best effort, a small search never fails because of it.
+            try:
+                restore_size(session, plan.warehouse)
+            except Exception:
+                pass
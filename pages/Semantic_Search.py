@@ -1,7 +1,12 @@
 import streamlit as st
 from snowflake.core import Root
 from snowflake.snowpark.context import get_active_session
-import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from logsearch import corpus
+from logsearch import results as result_arrow
+from logsearch.query import RESULT_COLUMNS
 
 session = get_active_session()
 root = Root(session)
@@ -212,7 +217,7 @@ if search_clicked and search_query and search_query.strip():
 
         search_kwargs = {
             "query": search_query.strip(),
-            "columns": ["LOG_ID", "TIMESTAMP", "SEVERITY", "SOURCE", "HOST", "MESSAGE"],
+            "columns": RESULT_COLUMNS,
             "limit": max_results,
         }
         if filter_obj:
@@ -234,11 +239,28 @@ if st.session_state.get("sem_results") is not None:
     if len(results) == 0:
         st.caption("該当するログが見つかりませんでした。別の表現で検索してみてください。")
     else:
+        # One columnar conversion of the search response
+        result_table = result_arrow.from_records(results, RESULT_COLUMNS)
+        timestamps = pc.cast(result_table.column("TIMESTAMP"), "string")
+        result_table = result_table.set_column(
+            1, "TIMESTAMP", pc.utf8_slice_codeunits(timestamps, 0, 19)
+        )
+
+        # Each hit stands for every occurrence of its message template
+        try:
+            seen = corpus.occurrences(session, result_table.column("LOG_ID").to_pylist())
+        except Exception:
+            seen = {}   # LOGS_SMALL built without logsearch.corpus (no strata table)
+        if seen:
+            log_ids = [int(i) for i in result_table.column("LOG_ID").to_pylist()]
+            result_table = result_table.append_column(
+                "OCCURRENCES", pa.array([seen.get(i, (None,))[0] for i in log_ids], type=pa.int64())
+            ).append_column(
+                "LAST_SEEN", pa.array([str(seen[i][2])[:19] if i in seen else None for i in log_ids], type=pa.string())
+            )
+
         # Summary metrics
-        sev_counts = {}
-        for r in results:
-            s = r.get("SEVERITY", "UNKNOWN")
-            sev_counts[s] = sev_counts.get(s, 0) + 1
+        sev_counts = dict(result_arrow.value_counts(result_table, "SEVERITY").values.tolist())
 
         cols = st.columns(min(len(sev_counts) + 1, 6))
         cols[0].metric("Total", len(results))
@@ -252,36 +274,26 @@ if st.session_state.get("sem_results") is not None:
                 cols[i + 1].metric(sev, cnt)
 
         # Result table
-        rows = []
-        for r in results:
-            data = dict(r)
-            rows.append({
-                "LOG_ID": data.get("LOG_ID", ""),
-                "TIMESTAMP": str(data.get("TIMESTAMP", ""))[:19],
-                "SEVERITY": data.get("SEVERITY", ""),
-                "SOURCE": data.get("SOURCE", ""),
-                "HOST": data.get("HOST", ""),
-                "MESSAGE": data.get("MESSAGE", ""),
-            })
-        result_df = pd.DataFrame(rows)
-        st.dataframe(result_df, use_container_width=True)
+        st.dataframe(result_table, use_container_width=True)
 
         # --- RAG: AI Analysis Button ---
         st.markdown("---")
         if st.button("AI分析（まとめ・考察を生成）"):
             with st.spinner("Cortex Complete で分析中..."):
-                log_lines = []
-                for r in results:
-                    data = dict(r)
-                    sev = data.get("SEVERITY", "")
-                    ts = str(data.get("TIMESTAMP", ""))[:19]
-                    source = data.get("SOURCE", "")
-                    host = data.get("HOST", "")
-                    message = data.get("MESSAGE", "")
-                    log_lines.append(
-                        f"[{sev}] {ts} | {source} | {host} | {message}"
-                    )
-                context = "\n".join(log_lines)
+                columns = [
+                    result_table.column(name).to_pylist()
+                    for name in ["SEVERITY", "TIMESTAMP", "SOURCE", "HOST", "MESSAGE"]
+                ]
+                counts = (
+                    result_table.column("OCCURRENCES").to_pylist()
+                    if "OCCURRENCES" in result_table.column_names
+                    else [None] * result_table.num_rows
+                )
+                context = "\n".join(
+                    f"[{sev}] {ts} | {source} | {host} | {message}"
+                    + (f" (同種のログ {count} 件)" if count else "")
+                    for sev, ts, source, host, message, count in zip(*columns, counts)
+                )
 
                 saved_query = st.session_state.get("sem_query", "")
                 prompt = f"""あなたはログ分析の専門家です。以下のログデータはセマンティック検索によって「{saved_query}」というクエリに関連すると判定されたログです。